@@ -137,11 +137,7 @@ class JoystickActionProjection(
             self._proto_spec.control_frame)
       else:
         # Use world-centric control-frame.
-        batch_dims = means.shape[:-1]
-        # Create neutral orientation quaternions for each batch entry.
-        frame_orientation = tf.broadcast_to(
-            tf.constant([0, 0, 0, 1], dtype=tf.float32),
-            tf.concat([batch_dims, [4]], axis=0))
+        frame_orientation = None
 
       # Postprocess signal to be in control frame.
       return egocentric.egocentric_signal_to_target_frame(
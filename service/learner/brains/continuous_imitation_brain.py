@@ -19,7 +19,6 @@ import glob
 import math
 import os
 import platform
-import random
 import shutil
 import time
 import uuid
@@ -34,12 +33,12 @@ from learner.brains import policies
 from learner.brains import saved_model_to_tflite_model
 from learner.brains import tfa_specs
 from log import falken_logging
+import numpy as np
 import tensorflow as tf
 # Used to workaround https://github.com/tensorflow/tensorflow/issues/41380
 from tensorflow.python.framework import errors as tf_errors
 from tensorflow.python.lib.io import file_io as tf_file_io
 from tf_agents.agents.behavioral_cloning import behavioral_cloning_agent
-from tf_agents.policies import greedy_policy
 from tf_agents.policies import policy_saver
 from tf_agents.trajectories import time_step as ts
 from tf_agents.utils import common
@@ -91,6 +90,21 @@ class BCAgent(behavioral_cloning_agent.BehavioralCloningAgent):
     # checkpoint.
     self.policy.variables()
 
+    if hparams['use_tf_function']:
+      # Eval data is batched along a single outer (time) dimension whose size
+      # varies between eval dataset versions, so trace the evaluation function
+      # once for all sizes.
+      self._evaluate_fn = common.function(
+          self._evaluate,
+          autograph=True,
+          input_signature=[tf.nest.map_structure(
+              lambda spec: tf.TensorSpec(  # pylint: disable=g-long-lambda
+                  tf.TensorShape([None]).concatenate(spec.shape),
+                  dtype=spec.dtype, name=spec.name),
+              self.collect_data_spec)])
+    else:
+      self._evaluate_fn = self._evaluate
+
   def _dict_loss(self, experience, training=True):
     batch_size = (
         tf.compat.dimension_value(experience.step_type.shape[0]) or
@@ -154,9 +168,29 @@ class BCAgent(behavioral_cloning_agent.BehavioralCloningAgent):
         # round-robin fashion. A value of 50 should ensure that the sample is
         # representative even for larger replay buffers while adding around
         # ~35% to required memory compared to the replay buffer.
-        num_batches_to_sample=50))
+        num_batches_to_sample=50,
+        # 'demo_buffer_compress_threshold' is the number of steps of an
+        # in-progress episode after which its observation and action protos
+        # are compressed in chunks of this size to bound the memory used by
+        # long episodes. None disables compression.
+        demo_buffer_compress_threshold=None))
 
   def evaluate(self, data):
+    """Dispatch to the evaluation function selected by use_tf_function.
+
+    This calls the traced _evaluate_fn, whose input signature has an unknown
+    outer dimension so it is traced once for all eval set sizes, or _evaluate
+    eagerly if use_tf_function is disabled.
+
+    Args:
+      data: Trajectory of eval data batched along a single outer dimension.
+
+    Returns:
+      See _evaluate().
+    """
+    return self._evaluate_fn(data)
+
+  def _evaluate(self, data):
     """Compute average eval loss for a trajectory of data."""
     with tf.name_scope('eval_loss'):
       loss = self._dict_loss(data)
@@ -172,6 +206,20 @@ def _outer_dim_length(nested_tensor):
     return len(flat[0])
 
 
+def _add_time_dim_to_spec(spec_nest):
+  """Add a time dimension of 1 after the batch dimension to a nest of specs."""
+  return tf.nest.map_structure(
+      lambda spec: tf.TensorSpec(tf.TensorShape([1]).concatenate(spec.shape),
+                                 dtype=spec.dtype, name=spec.name),
+      spec_nest)
+
+
+def _add_time_dim(tensor_nest):
+  """Add a time dimension of 1 after the batch dimension to a tensor nest."""
+  return tf.nest.map_structure(lambda x: np.expand_dims(x, axis=1),
+                               tensor_nest)
+
+
 def _select_sub_trajectories(traj_generator,
                              select_fraction,
                              rng):
@@ -185,23 +233,37 @@ def _select_sub_trajectories(traj_generator,
     traj_generator: Generates pairs (trajectory, length) where length indicates
         the size of the outermost (=time) dimension of the trajectory data.
     select_fraction: Fraction of the trajectory to select.
-    rng: Random number generator.
+    rng: numpy.random.Generator instance.
 
   Yields:
     Triplets of trajectory (before, selected, after), which randomly subdivide
     the trajectory object into three subtrajectories. The middle element has
     length select_fraction * trajectory_length. Note that tuple elements yielded
-    will be None if any trajectory segment would have length 0.
+    will be None if any trajectory segment would have length 0. Leaves of
+    yielded trajectories are numpy arrays.
   """
-  for trajectory, frames in traj_generator:
-    select_frames = int(select_fraction * frames)
-
+  trajectories = list(traj_generator)
+  if not trajectories:
+    return
+  select_frames_list = [int(select_fraction * frames)
+                        for _, frames in trajectories]
+  # Draw the start of the selected segment for all trajectories at once.
+  starts = rng.integers(
+      0, [frames - select_frames for (_, frames), select_frames in zip(
+          trajectories, select_frames_list)],
+      endpoint=True)
+
+  for (trajectory, frames), select_frames, start in zip(
+      trajectories, select_frames_list, starts):
+    # Slice numpy arrays rather than eager tensors, which is significantly
+    # cheaper for the small arrays in each trajectory and returns views
+    # rather than copies.
+    trajectory = tf.nest.map_structure(np.asarray, trajectory)
     if not select_frames:
       yield trajectory, None, None
       continue
 
-    last_select_index = frames - select_frames
-    start = rng.randint(0, last_select_index)
+    start = int(start)
     end = start + select_frames
     assert end <= frames
 
@@ -247,24 +309,43 @@ def _generate_random_steps(number_of_frames, brain_spec):
     demonstration_buffer.Step instance populated with random data that
     conforms to the provided brain_spec.
   """
+  generator = data_protobuf_generator.DataProtobufGenerator
+  generate_observation = generator.generator_from_spec_node(
+      brain_spec.observation_spec.proto_node)
+  generate_action = generator.generator_from_spec_node(
+      brain_spec.action_spec.proto_node)
   for i, step_phase in demonstration_buffer.generate_index_and_step_phase(
       number_of_frames, demonstration_buffer.StepPhase.SUCCESS):
     yield demonstration_buffer.Step(
-        observation_pb=(
-          data_protobuf_generator.DataProtobufGenerator.from_spec_node(
-            brain_spec.observation_spec.proto_node,
-            modify_data_proto=(
-                data_protobuf_generator.DataProtobufGenerator.
-                  randomize_leaf_data_proto)))[0],
+        observation_pb=generate_observation(
+            modify_data_proto=generator.randomize_leaf_data_proto)[0],
         reward=0, phase=step_phase, episode_id='0',
-        action_pb=data_protobuf_generator.DataProtobufGenerator.from_spec_node(
-            brain_spec.action_spec.proto_node,
-            modify_data_proto=(
-                data_protobuf_generator.DataProtobufGenerator.
-                  randomize_leaf_data_proto))[0],
+        action_pb=generate_action(
+            modify_data_proto=generator.randomize_leaf_data_proto)[0],
         timestamp_micros=i)
 
 
+def _drop_file_from_page_cache(filename):
+  """Advise the OS that cached pages of a file will not be accessed again.
+
+  This is a no-op on platforms that do not support posix_fadvise().
+
+  Args:
+    filename: File to evict from the page cache.
+  """
+  if not hasattr(os, 'posix_fadvise'):
+    return
+  try:
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+      os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+      os.close(fd)
+  except OSError as e:
+    # The advice is optional so just log failures.
+    falken_logging.warn(f'Failed to drop {filename} from the page cache: {e}')
+
+
 def _atomic_write_string_to_file(filename, contents, overwrite=True):
   """Write a string to a file.
 
@@ -364,7 +445,7 @@ class ContinuousImitationBrain:
     self.brain_spec = tfa_specs.BrainSpec(spec_pb)
 
     self.tf_agent = None
-    self._eval_split_rng = random.Random(self._EVAL_SPLIT_SEED)
+    self._eval_split_rng = np.random.default_rng(self._EVAL_SPLIT_SEED)
     self._demo_buffer = None
     self._eval_datastore = None
     self._replay_buffer = None
@@ -406,16 +487,18 @@ class ContinuousImitationBrain:
 
   def _initialize_step_buffers(self):
     """Initialize the replay buffer, demo buffer and eval datastore."""
-    # TF Replay buffer
+    # TF Replay buffer. TF agents expects a time dimension so data is stored
+    # with a dummy time dimension of 1 after the batch dimension.
     self._replay_buffer = numpy_replay_buffer.NumpyReplayBuffer(
-        self.tf_agent.collect_data_spec,
+        _add_time_dim_to_spec(self.tf_agent.collect_data_spec),
         capacity=self._replay_buffer_capacity)
     self._reinitialize_dataset()
 
     # Temporary data buffer that accumulates full episodes before dividing the
     # data between training and eval set
     self._demo_buffer = demonstration_buffer.DemonstrationBuffer(
-        self.brain_spec)
+        self.brain_spec,
+        compress_threshold=self._hparams['demo_buffer_compress_threshold'])
 
     # Storage for eval data.
     self._eval_datastore = eval_datastore.EvalDatastore()
@@ -444,10 +527,13 @@ class ContinuousImitationBrain:
         self._get_experiences = common.function(
             self._py_fun_get_experiences,
             autograph=True)
+        # Experiences always have the same shape as the dataset drops
+        # partial batches so trace the train step function once up front.
         self._train_step = common.function(
             self._py_fun_train_step,
             autograph=True,
-            experimental_compile=self._hparams['use_xla_jit'])
+            jit_compile=self._hparams['use_xla_jit'],
+            input_signature=[self._experiences_spec()])
       else:
         self._get_experiences = self._py_fun_get_experiences
         self._train_step = self._py_fun_train_step
@@ -458,7 +544,13 @@ class ContinuousImitationBrain:
 
       # Force JIT compilation.
       if compile_graph:
-        self._compile_graph()
+        if tf.train.latest_checkpoint(self._checkpoint_path):
+          # Weights will be restored from the checkpoint so avoid training on
+          # random data and just create the policy variables. The training
+          # graph is compiled on the first call to train().
+          self._compile_policy()
+        else:
+          self._compile_graph()
 
       # Keys are names, values are trackable objects (see tf.train.Checkpoint
       # for details on trackables).
@@ -493,8 +585,8 @@ class ContinuousImitationBrain:
     #
     # So instead this populates the demonstration buffer with random data
     # and trains for a single step to force compilation.
-    self._replay_buffer.Add(demonstration_buffer.batch_trajectories(
-        demonstration_buffer.episode_steps_to_trajectories(
+    self._replay_buffer.Add(_add_time_dim(
+        demonstration_buffer.episode_steps_to_batched_trajectory(
             _generate_random_steps(self._hparams['batch_size'] *
                                    self._hparams['num_batches_to_sample'],
                                    self.brain_spec),
@@ -509,6 +601,23 @@ class ContinuousImitationBrain:
     self._replay_buffer.Clear()
     self._reinitialize_dataset()
 
+  def _compile_policy(self):
+    """Create the policy network variables so a checkpoint can restore them.
+
+    This runs the policy eagerly on a single random step, which creates the
+    variables of the network without training on random data.
+    """
+    step = next(_generate_random_steps(1, self.brain_spec))
+    # Add a batch dimension of 1.
+    time_step = tf.nest.map_structure(
+        lambda x: tf.expand_dims(x, axis=0),
+        step.get_time_step(self.brain_spec.observation_spec))
+    initial_time = time.perf_counter()
+    self.tf_agent.policy.action(time_step)
+    falken_logging.info(
+        'Created policy variables in '
+        f'{time.perf_counter() - initial_time}s')
+
   @property
   def num_train_frames(self):
     """Number of frames collected for training."""
@@ -577,20 +686,18 @@ class ContinuousImitationBrain:
     if self._dataset:
       return
 
-    # TF agents expects a time dimension, so we add one dummy dimension in
-    # front.
-    def _add_time_dim(tensor_nest):
-      # Add dummy time dimension of 1.
-      return tf.nest.map_structure(lambda x: tf.expand_dims(x, axis=0),
-                                   tensor_nest)
-
-    ds = self._replay_buffer.AsDataset().map(_add_time_dim).cache().repeat()
-    ds = ds.shuffle(
-        self._replay_buffer.size).batch(self._hparams['batch_size'])
+    # Elements in the replay buffer already have the dummy time dimension
+    # expected by TF agents (see _initialize_step_buffers()).
+    # The dataset is sliced from in-memory numpy arrays so there is no need to
+    # cache it, instead it's reshuffled on each pass over the replay buffer.
+    ds = self._replay_buffer.AsDataset().shuffle(
+        self._replay_buffer.size, reshuffle_each_iteration=True).repeat()
+    # Remainders are dropped so that batches have a static shape.
+    ds = ds.batch(self._hparams['batch_size'], drop_remainder=True)
     # We apply a second batch dimension so that a batch of batches can be
     # prefetched before we enter the XLA/jit translated train function.
     # (which does not like the 'next' operator)
-    ds = ds.batch(self._hparams['num_batches_to_sample'])
+    ds = ds.batch(self._hparams['num_batches_to_sample'], drop_remainder=True)
     ds = ds.prefetch(buffer_size=tf.data.experimental.AUTOTUNE)
     self._dataset = ds
     self._dataset_iterator = iter(ds)
@@ -632,16 +739,30 @@ class ContinuousImitationBrain:
         action_pb: Action data from brain or user.
         timestamp_micros: Microsecond timestamp of the step.
     """
-    self._demo_buffer.record_step(
+    self.record_steps([
         demonstration_buffer.Step(
             observation_pb=observation_pb,
             reward=reward,
             phase=phase,
             episode_id=episode_id,
             action_pb=action_pb,
-            timestamp_micros=timestamp_micros))
+            timestamp_micros=timestamp_micros)])
+
+  def record_steps(self, steps):
+    """Records a sequence of known state+action pairs from given envs.
+
+    Episodes completed by the steps are added to the training and eval buffers
+    after all steps are recorded so that the training dataset is rebuilt at
+    most once.
+
+    Args:
+        steps: Iterable of demonstration_buffer.Step instances.
+    """
+    for step in steps:
+      self._demo_buffer.record_step(step)
 
     # Add new completed episodes to buffers.
+    added_training_frames = False
     for before, eval_trajectory, after in _select_sub_trajectories(
         self._demo_buffer.flush_episode_demonstrations(),
         self._EVAL_FRACTION, self._eval_split_rng):
@@ -656,13 +777,12 @@ class ContinuousImitationBrain:
       for trajectory in [before, after]:
         if not trajectory:  # Skip empty trajectory chunks.
           continue
-        self._replay_buffer.Add(trajectory)
+        self._replay_buffer.Add(_add_time_dim(trajectory))
         chunk_size = _outer_dim_length(trajectory)
         self._num_train_frames.assign_add(chunk_size)
+        added_training_frames = True
         falken_logging.info(f'Added {chunk_size} training frames.')
 
-      self._reinitialize_dataset()
-
       if eval_trajectory:
         self._eval_datastore.add_trajectory(eval_trajectory)
         chunk_size = _outer_dim_length(eval_trajectory)
@@ -670,6 +790,9 @@ class ContinuousImitationBrain:
         self._eval_datastore.create_version()
         falken_logging.info(f'Added {chunk_size} eval frames.')
 
+    if added_training_frames:
+      self._reinitialize_dataset()
+
   def clear_step_buffers(self):
     """Clear all steps from demo, eval and replay buffers."""
     # Reset training and eval counters.
@@ -688,8 +811,9 @@ class ContinuousImitationBrain:
 
   def _create_export_policy(self):
     """Creates the policy for export based on hparams."""
-    assert isinstance(self.tf_agent.policy, greedy_policy.GreedyPolicy)
-    stochastic_policy = self.tf_agent.policy.wrapped_policy
+    # The collect policy samples from the action distributions of the cloning
+    # network, so use it directly rather than unwrapping the greedy policy.
+    stochastic_policy = self.tf_agent.collect_policy
     policy_type = self._hparams['policy_type']
 
     if policy_type == 'greedy':
@@ -723,6 +847,10 @@ class ContinuousImitationBrain:
 
   def convert_model_to_tflite(self, saved_model_path, tflite_path):
     """Convert saved model to tf-lite model."""
+    # NOTE: The model is converted from the exported SavedModel rather than
+    # the in-memory policy's concrete function as the tensor names of the
+    # TF Lite model are patched to match the SavedModel's serving signature,
+    # which is only available once the signature has been serialized.
     filename = 'model.tflite'
     os.makedirs(tflite_path, exist_ok=True)
     tflite_file = os.path.join(tflite_path, filename)
@@ -758,6 +886,9 @@ class ContinuousImitationBrain:
       else:
         # Create a hard link to the checkpoint file in the output directory.
         os.link(checkpoint_filename, target_filename)
+        # The checkpoint isn't read back while training so avoid it evicting
+        # training data from the page cache.
+        _drop_file_from_page_cache(checkpoint_filename)
 
   def full_eval_from_datastore(self, eval_ds):
     """Same as compute_full_evaluation, but from an external EvalDatastore.
@@ -806,13 +937,31 @@ class ContinuousImitationBrain:
             # TODO(lph): Check if we need to use a separate summary path.
             summary_path=self._summary_path,
             replay_buffer_capacity=self._replay_buffer_capacity,
-            hparams=self._hparams)
+            hparams=self._hparams,
+            # The eval brain is never trained and its weights are restored
+            # from the checkpoint so there is no need to compile the training
+            # graph.
+            compile_graph=False)
         if not eval_brain.latest_checkpoint:
           raise NoCheckpointFoundError(
               f'No checkpoints found in dir {cp_path}, {cp_path}/* is '
               + str(glob.glob(cp_path + '*')))
         yield from eval_brain.full_eval_from_datastore(self._eval_datastore)
 
+  def _experiences_spec(self):
+    """Get the spec of the experiences passed to _py_fun_train_step.
+
+    Returns:
+      Nest of TensorSpec instances matching the agent's collect data spec with
+      num_batches_to_sample x batch_size x 1 (time) outer dimensions.
+    """
+    outer_shape = tf.TensorShape([self._hparams['num_batches_to_sample'],
+                                  self._hparams['batch_size']])
+    return tf.nest.map_structure(
+        lambda spec: tf.TensorSpec(outer_shape.concatenate(spec.shape),
+                                   dtype=spec.dtype, name=spec.name),
+        _add_time_dim_to_spec(self.tf_agent.collect_data_spec))
+
   def _py_fun_get_experiences(self, iterator):
     """Return a batch of batches for use in _py_fun_train_step.
 
@@ -829,7 +978,7 @@ class ContinuousImitationBrain:
     """Train for a single step.
 
     We pre-sample batches and consider them as input so that this function
-    can be translated via experimental_compile=True with JIT XLA compilation.
+    can be translated via jit_compile=True with JIT XLA compilation.
     (The 'next' function does not support JIT XLA compilation right now.)
 
     Args:
@@ -840,16 +989,44 @@ class ContinuousImitationBrain:
         train function. (The datastructure is generated by calling the function
         on the generating dataset - which is already batched).
     """
-    num_batches = self._hparams['num_batches_to_sample']
-    for i in tf.range(self._hparams['training_steps']):
-      def _select_outer_batch(tensor):
-        """Selects the ith outer batch of a tensor."""
-        # Using the loop variable i is ok here, since we're only ever using the
-        # function inside the loop.
-        return tensor[i % num_batches]  # pylint: disable=cell-var-from-loop
-      # Data in experiences has two batch dimensions (see the generation of the
-      # dataset object in _setup_dataset()). We now create an object
-      # that selects an outer batch, thus leaving the resulting object with
-      # only one batch dimension.
-      experience = tf.nest.map_structure(_select_outer_batch, experiences)
-      self.tf_agent.train(experience=experience)
+    training_steps = self._hparams['training_steps']
+    # Flatten the nest once rather than traversing it on each training step.
+    flat_experiences = tf.nest.flatten(experiences)
+    # Explicitly build the training loop as a single sequential while loop so
+    # that all training steps are translated into the same graph / XLA
+    # cluster. maximum_iterations gives the loop a static trip count so that
+    # XLA does not need to treat it as unbounded.
+    tf.while_loop(
+        lambda i: i < training_steps,
+        lambda i: (self._py_fun_train_outer_batch(  # pylint: disable=g-long-lambda
+            experiences, flat_experiences, i),),
+        (tf.constant(0),), parallel_iterations=1,
+        maximum_iterations=training_steps)
+
+  def _py_fun_train_outer_batch(self, experiences, flat_experiences, i):
+    """Train on a single outer batch of experiences.
+
+    This is called from the body of the training loop in _py_fun_train_step()
+    so it is compiled as part of the train step function.
+
+    Args:
+      experiences: A Trajectory with data batched across two dimensions, see
+        _py_fun_train_step(). Only used for its structure.
+      flat_experiences: Flattened list of tensors in experiences.
+      i: Index of the training step, used to select the outer batch
+        round robin.
+
+    Returns:
+      Index of the next training step.
+    """
+    outer_batch_index = i % self._hparams['num_batches_to_sample']
+    # Data in experiences has two batch dimensions (see the generation of the
+    # dataset object in _setup_dataset()). We now create an object
+    # that selects an outer batch, thus leaving the resulting object with
+    # only one batch dimension.
+    experience = tf.nest.pack_sequence_as(
+        experiences,
+        [tf.gather(tensor, outer_batch_index, axis=0)
+         for tensor in flat_experiences])
+    self.tf_agent.train(experience=experience)
+    return i + 1
@@ -65,12 +65,13 @@ class ContinuousImitationBrainTest(parameterized.TestCase):
     self.temp_dirs.append(temp_dir)
     return temp_dir.name
 
-  def _init_brain(self):
+  def _init_brain(self, **hparam_overrides):
     hparams = continuous_imitation_brain.BCAgent.default_hparams()
     hparams['use_xla_jit'] = False
     hparams['num_batches_to_sample'] = 5
     hparams['batch_size'] = 500
     hparams['training_examples'] = 500
+    hparams.update(hparam_overrides)
     self.brain = continuous_imitation_brain.ContinuousImitationBrain(
         brain_id=0,
         spec_pb=self.brain_spec,
@@ -80,22 +81,20 @@ class ContinuousImitationBrainTest(parameterized.TestCase):
     self.assertEqual(self.brain.hparams['training_steps'], 1)
 
   def test_trajectory_subdivision(self):
-    self._init_brain()
-
     def test_generator():
-      yield {'a': tf.constant([0, 1, 2, 3, 4])}, 5
-      yield {'a': tf.constant([0, 1, 2, 3, 4, 5])}, 6
-      yield {'a': tf.constant([0, 1, 2, 3, 4, 5])}, 6
+      yield {'a': np.asarray([0, 1, 2, 3, 4], dtype=np.int32)}, 5
+      yield {'a': np.asarray([0, 1, 2, 3, 4, 5], dtype=np.int32)}, 6
+      yield {'a': np.asarray([0, 1, 2, 3, 4, 5], dtype=np.int32)}, 6
 
     rng = mock.MagicMock()
-    rng.randint.side_effect = [0, 2, 5]
+    rng.integers.return_value = [0, 2, 5]
 
     result = list(
         continuous_imitation_brain._select_sub_trajectories(
             test_generator(), 0.2, rng))
 
-    result = tf.nest.map_structure(  # convert tensors to lists
-        lambda x: x.numpy().tolist() if hasattr(x, 'numpy') else x, result)
+    result = tf.nest.map_structure(  # convert arrays to lists
+        lambda x: x.tolist() if isinstance(x, np.ndarray) else x, result)
 
     self.assertEqual(result[0], (None, {'a': [0]}, {'a': [1, 2, 3, 4]}))
 
@@ -144,12 +143,15 @@ class ContinuousImitationBrainTest(parameterized.TestCase):
         if constant else self._random_step_generator)
     reward = 0
     for episode_index in range(number_of_episodes):
+      steps = []
       for i, step_phase in (demonstration_buffer.generate_index_and_step_phase(
           steps_per_episode, demonstration_buffer.StepPhase.SUCCESS)):
         observation_data, action_data = next(step_generator())
-        self.brain.record_step(observation_data, reward, step_phase,
-                               first_episode_id + episode_index, action_data,
-                               episode_index + i)
+        steps.append(demonstration_buffer.Step(
+            observation_pb=observation_data, reward=reward, phase=step_phase,
+            episode_id=first_episode_id + episode_index, action_pb=action_data,
+            timestamp_micros=episode_index + i))
+      self.brain.record_steps(steps)
 
   def test_short_episodes(self):
     self._init_brain()
@@ -168,6 +170,16 @@ class ContinuousImitationBrainTest(parameterized.TestCase):
     # Check that we have some versions in the eval datastore.
     self.assertNotEmpty(self.brain._eval_datastore.versions)
 
+  def test_compressed_demo_buffer(self):
+    """Test recording episodes with demonstration buffer compression."""
+    self._init_brain(demo_buffer_compress_threshold=2)
+    steps_per_episode = 7
+    episodes_to_run = 10
+    self._add_training_data_to_brain(episodes_to_run, steps_per_episode)
+
+    got_frames = self.brain.num_train_frames + self.brain.num_eval_frames
+    self.assertEqual(got_frames, (steps_per_episode - 1) * episodes_to_run)
+
   def test_train_brain(self):
     """Tests training a brain using continuous imitation learning."""
     self._init_brain()
@@ -335,8 +347,6 @@ class ContinuousImitationBrainTest(parameterized.TestCase):
 
   @parameterized.parameters((1,), (2,), (3,))
   def test_only_discrete_actions(self, num_actions):
-    self._init_brain()
-    self.brain_spec.action_spec.Clear()
     spec = self.brain_spec.action_spec
     spec.Clear()
 
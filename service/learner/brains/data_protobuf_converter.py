@@ -28,9 +28,6 @@ class ConversionError(Exception):
 class DataProtobufConverter:
   """Converts a data proto to a tensor."""
 
-  # Lazily initialized by to_tensor().
-  _DATA_PROTO_CLASS_TO_CONVERTER = None
-
   @staticmethod
   def _category_to_tensor(data):
     """Convert a Category proto to a tensor.
@@ -80,30 +77,55 @@ class DataProtobufConverter:
     return np.array([data.x, data.y, data.z, data.w], dtype=np.float32)
 
   @staticmethod
-  def _feeler_to_tensor(data):
-    """Convert a Feeler proto to a tensor.
+  def _append_feeler_values(data, values):
+    """Append the values of each measurement in a Feeler proto to a list.
 
     Args:
       data: Feeler proto.
+      values: List to append the distance followed by experimental data of
+        each measurement to.
 
     Returns:
-      Numpy tensor.
+      (count, experimental_data_count) tuple where count is the number of
+      measurements and experimental_data_count is the number of experimental
+      data values of each measurement.
     """
     measurements = data.measurements
     count = len(measurements)
     experimental_data_count = (
         len(measurements[0].experimental_data) if count else 0)
-    values = np.empty([count, 1 + experimental_data_count], dtype=np.float32)
-    # NOTE: Accessing repeated fields by index is ~10% faster than enumerating
-    # which results in a temporary tuple being allocated then unpacked into two
-    # variables per iteration.
-    for i in range(count):
-      measurement = measurements[i]
-      values[i, 0] = measurement.distance.value
-      experimental_data = measurement.experimental_data
-      for j in range(experimental_data_count):
-        values[i, j + 1] = experimental_data[j].value
-    return values
+    # NOTE: Gathering values into a flat list and converting the list to an
+    # array in a single operation is much faster than assigning each element
+    # of a numpy array.
+    if experimental_data_count:
+      # Bind the list methods once rather than looking them up for each
+      # measurement.
+      append_value = values.append
+      extend_values = values.extend
+      for measurement in measurements:
+        append_value(measurement.distance.value)
+        extend_values(
+            [number.value for number in measurement.experimental_data])
+    else:
+      values.extend(
+          [measurement.distance.value for measurement in measurements])
+    return (count, experimental_data_count)
+
+  @staticmethod
+  def _feeler_to_tensor(data):
+    """Convert a Feeler proto to a tensor.
+
+    Args:
+      data: Feeler proto.
+
+    Returns:
+      Numpy tensor.
+    """
+    values = []
+    count, experimental_data_count = (
+        DataProtobufConverter._append_feeler_values(data, values))
+    return np.array(values, dtype=np.float32).reshape(
+        count, 1 + experimental_data_count)
 
   @staticmethod
   def _joystick_to_tensor(data):
@@ -117,6 +139,89 @@ class DataProtobufConverter:
     """
     return np.array([data.x_axis, data.y_axis], dtype=np.float32)
 
+  @staticmethod
+  def _categories_to_tensor(data_list):
+    """Convert a sequence of Category protos to a tensor.
+
+    Args:
+      data_list: Sequence of Category protos.
+
+    Returns:
+      [N, 1] numpy array.
+    """
+    return np.array([data.value for data in data_list],
+                    dtype=np.int32).reshape(-1, 1)
+
+  @staticmethod
+  def _numbers_to_tensor(data_list):
+    """Convert a sequence of Number protos to a tensor.
+
+    Args:
+      data_list: Sequence of Number protos.
+
+    Returns:
+      [N, 1] numpy array.
+    """
+    return np.array([data.value for data in data_list],
+                    dtype=np.float32).reshape(-1, 1)
+
+  @staticmethod
+  def _positions_to_tensor(data_list):
+    """Convert a sequence of Position protos to a tensor.
+
+    Args:
+      data_list: Sequence of Position protos.
+
+    Returns:
+      [N, 3] numpy array.
+    """
+    return np.array([(data.x, data.y, data.z) for data in data_list],
+                    dtype=np.float32).reshape(-1, 3)
+
+  @staticmethod
+  def _rotations_to_tensor(data_list):
+    """Convert a sequence of Rotation protos to a tensor.
+
+    Args:
+      data_list: Sequence of Rotation protos.
+
+    Returns:
+      [N, 4] numpy array.
+    """
+    return np.array([(data.x, data.y, data.z, data.w) for data in data_list],
+                    dtype=np.float32).reshape(-1, 4)
+
+  @staticmethod
+  def _feelers_to_tensor(data_list):
+    """Convert a sequence of Feeler protos to a tensor.
+
+    Args:
+      data_list: Sequence of Feeler protos.
+
+    Returns:
+      [N, count, 1 + experimental_data_count] numpy array.
+    """
+    values = []
+    count, experimental_data_count = 0, 0
+    for data in data_list:
+      count, experimental_data_count = (
+          DataProtobufConverter._append_feeler_values(data, values))
+    return np.array(values, dtype=np.float32).reshape(
+        len(data_list), count, 1 + experimental_data_count)
+
+  @staticmethod
+  def _joysticks_to_tensor(data_list):
+    """Convert a sequence of Joystick protos to a tensor.
+
+    Args:
+      data_list: Sequence of Joystick protos.
+
+    Returns:
+      [N, 2] numpy array.
+    """
+    return np.array([(data.x_axis, data.y_axis) for data in data_list],
+                    dtype=np.float32).reshape(-1, 2)
+
   @staticmethod
   def leaf_to_tensor(data, name):
     """Convert the specified data proto to a tensor.
@@ -132,17 +237,57 @@ class DataProtobufConverter:
     Raises:
       ConversionError: If the data can't be converted.
     """
-    if not DataProtobufConverter._DATA_PROTO_CLASS_TO_CONVERTER:
-      DataProtobufConverter._DATA_PROTO_CLASS_TO_CONVERTER = {
-          primitives_pb2.Category: DataProtobufConverter._category_to_tensor,
-          primitives_pb2.Number: DataProtobufConverter._number_to_tensor,
-          primitives_pb2.Position: DataProtobufConverter._position_to_tensor,
-          primitives_pb2.Rotation: DataProtobufConverter._rotation_to_tensor,
-          observation_pb2.Feeler: DataProtobufConverter._feeler_to_tensor,
-          action_pb2.Joystick: DataProtobufConverter._joystick_to_tensor,
-      }
-    converter = DataProtobufConverter._DATA_PROTO_CLASS_TO_CONVERTER.get(
-        type(data))
+    converter = _DATA_PROTO_CLASS_TO_CONVERTER.get(type(data))
     if not converter:
       raise ConversionError(f'Failed to convert {name} ({data}) to a tensor.')
     return converter(data)
+
+  @staticmethod
+  def leaves_to_tensor_batch(data_list, name):
+    """Convert a sequence of data protos of the same type to a batched tensor.
+
+    This is equivalent to stacking the result of leaf_to_tensor() for each
+    proto but only allocates a single array.
+
+    Args:
+      data_list: Non-empty sequence of data protobufs of the same type. These
+        should be validated against a spec using ProtobufValidator before
+        conversion.
+      name: Name to report if conversion fails.
+
+    Returns:
+      Numpy array / tensor where the outer dimension is the batch dimension.
+
+    Raises:
+      ConversionError: If the data can't be converted.
+    """
+    converter = (_DATA_PROTO_CLASS_TO_BATCH_CONVERTER.get(type(data_list[0]))
+                 if data_list else None)
+    if not converter:
+      raise ConversionError(
+          f'Failed to convert {name} ({list(data_list)}) to a tensor.')
+    return converter(data_list)
+
+
+# Maps data proto classes to methods that convert instances to tensors.
+# pylint: disable=protected-access
+_DATA_PROTO_CLASS_TO_CONVERTER = {
+    primitives_pb2.Category: DataProtobufConverter._category_to_tensor,
+    primitives_pb2.Number: DataProtobufConverter._number_to_tensor,
+    primitives_pb2.Position: DataProtobufConverter._position_to_tensor,
+    primitives_pb2.Rotation: DataProtobufConverter._rotation_to_tensor,
+    observation_pb2.Feeler: DataProtobufConverter._feeler_to_tensor,
+    action_pb2.Joystick: DataProtobufConverter._joystick_to_tensor,
+}
+
+# Maps data proto classes to methods that convert sequences of instances to
+# batched tensors.
+_DATA_PROTO_CLASS_TO_BATCH_CONVERTER = {
+    primitives_pb2.Category: DataProtobufConverter._categories_to_tensor,
+    primitives_pb2.Number: DataProtobufConverter._numbers_to_tensor,
+    primitives_pb2.Position: DataProtobufConverter._positions_to_tensor,
+    primitives_pb2.Rotation: DataProtobufConverter._rotations_to_tensor,
+    observation_pb2.Feeler: DataProtobufConverter._feelers_to_tensor,
+    action_pb2.Joystick: DataProtobufConverter._joysticks_to_tensor,
+}
+# pylint: enable=protected-access
@@ -14,6 +14,7 @@
 
 from absl.testing import absltest
 from learner.brains import data_protobuf_converter
+import numpy as np
 
 import common.generate_protos  # pylint: disable=unused-import
 import action_pb2
@@ -36,17 +37,17 @@ class DataProtobufConverterTest(absltest.TestCase):
     """Convert Category proto to tensor."""
     data = primitives_pb2.Category()
     data.value = 42
-    self.assertCountEqual(
+    np.testing.assert_array_equal(
         data_protobuf_converter.DataProtobufConverter.leaf_to_tensor(
-            data, 'category'), [42])
+            data, 'category'), np.array([42], dtype=np.int32))
 
   def test_number_to_tensor(self):
     """Convert Number proto to tensor."""
     data = primitives_pb2.Number()
     data.value = 3.0
-    self.assertCountEqual(
+    np.testing.assert_array_equal(
         data_protobuf_converter.DataProtobufConverter.leaf_to_tensor(
-            data, 'number'), [3.0])
+            data, 'number'), np.array([3.0], dtype=np.float32))
 
   def test_position_to_tensor(self):
     """Convert Position proto to tensor."""
@@ -54,10 +55,10 @@ class DataProtobufConverterTest(absltest.TestCase):
     data.x = 1.0
     data.y = 2.5
     data.z = 3.5
-    self.assertCountEqual(
+    np.testing.assert_array_equal(
         data_protobuf_converter.DataProtobufConverter.leaf_to_tensor(
             data, 'position'),
-        [1.0, 2.5, 3.5])
+        np.array([1.0, 2.5, 3.5], dtype=np.float32))
 
   def test_rotation_to_tensor(self):
     """Convert Rotation proto to tensor."""
@@ -66,10 +67,66 @@ class DataProtobufConverterTest(absltest.TestCase):
     data.y = -1.0
     data.z = 2.0
     data.w = 5.0
-    self.assertCountEqual(
+    np.testing.assert_array_equal(
         data_protobuf_converter.DataProtobufConverter.leaf_to_tensor(
             data, 'rotation'),
-        [1.0, -1.0, 2.0, 5.0])
+        np.array([1.0, -1.0, 2.0, 5.0], dtype=np.float32))
+
+  def test_feeler_to_tensor(self):
+    """Convert Feeler proto to tensor."""
+    data = observation_pb2.Feeler()
+    for i in range(3):
+      measurement = data.measurements.add()
+      measurement.distance.value = float(i)
+      measurement.experimental_data.add().value = i + 0.5
+      measurement.experimental_data.add().value = i + 0.25
+    self.assertEqual(
+        data_protobuf_converter.DataProtobufConverter.leaf_to_tensor(
+            data, 'feeler').tolist(),
+        [[0.0, 0.5, 0.25], [1.0, 1.5, 1.25], [2.0, 2.5, 2.25]])
+
+  def test_feeler_without_experimental_data_to_tensor(self):
+    """Convert Feeler proto with only distances to tensor."""
+    data = observation_pb2.Feeler()
+    for i in range(3):
+      data.measurements.add().distance.value = float(i)
+    self.assertEqual(
+        data_protobuf_converter.DataProtobufConverter.leaf_to_tensor(
+            data, 'feeler').tolist(),
+        [[0.0], [1.0], [2.0]])
+
+  def test_unknown_to_tensor_batch(self):
+    """Convert a sequence of unsupported protos to a batched tensor."""
+    with self.assertRaisesWithLiteralMatch(
+        data_protobuf_converter.ConversionError,
+        'Failed to convert observations ([]) to a tensor.'):
+      data_protobuf_converter.DataProtobufConverter.leaves_to_tensor_batch(
+          [], 'observations')
+
+  def test_positions_to_tensor_batch(self):
+    """Convert a sequence of Position protos to a batched tensor."""
+    data_list = [primitives_pb2.Position(x=1.0, y=2.0, z=3.0),
+                 primitives_pb2.Position(x=4.0, y=5.0, z=6.0)]
+    self.assertEqual(
+        data_protobuf_converter.DataProtobufConverter.leaves_to_tensor_batch(
+            data_list, 'position').tolist(),
+        [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+
+  def test_feelers_to_tensor_batch(self):
+    """Convert a sequence of Feeler protos to a batched tensor."""
+    data_list = []
+    for offset in range(2):
+      data = observation_pb2.Feeler()
+      for i in range(3):
+        measurement = data.measurements.add()
+        measurement.distance.value = float(offset + i)
+        measurement.experimental_data.add().value = offset + i + 0.5
+      data_list.append(data)
+    self.assertEqual(
+        data_protobuf_converter.DataProtobufConverter.leaves_to_tensor_batch(
+            data_list, 'feeler').tolist(),
+        [[[0.0, 0.5], [1.0, 1.5], [2.0, 2.5]],
+         [[1.0, 1.5], [2.0, 2.5], [3.0, 3.5]]])
 
 
 if __name__ == '__main__':
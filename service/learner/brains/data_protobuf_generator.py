@@ -14,35 +14,22 @@
 
 import random
 
+import numpy as np
+
 import common.generate_protos  # pylint: disable=unused-import
 
 import action_pb2
 import observation_pb2
 import primitives_pb2
 
+# Bound once so that randomizing each scalar is a single call.
+_uniform = random.uniform
+_randrange = random.randrange
+
 
 class DataProtobufGenerator:
   """Generates a data proto from an observation or action spec."""
 
-  # Lazily initialized in from_spec().
-  _SPEC_PROTO_CLASS_TO_CREATE_ADD_METHODS = None
-  # Lazily initialized in randomize_leaf_data_proto().
-  _DATA_PROTO_CLASS_TO_RANDOMIZE_METHOD = None
-
-  # Used by _add_to_action_data_proto() and
-  # _add_to_entity_proto() to map a data leaf proto to a field name.
-  _LEAF_DATA_PROTO_CLASS_TO_FIELD_NAME = {
-      primitives_pb2.Category: 'category',
-      primitives_pb2.Number: 'number',
-      action_pb2.Joystick: 'joystick',
-      observation_pb2.Feeler: 'feeler',
-  }
-
-  _ENTITY_DATA_PROTO_CLASS_TO_FIELD_NAME = {
-      primitives_pb2.Position: 'position',
-      primitives_pb2.Rotation: 'rotation',
-  }
-
   @staticmethod
   def _create_action_data_proto(unused_spec_proto):
     """Create an instance of the ActionData proto.
@@ -54,9 +41,8 @@ class DataProtobufGenerator:
       ActionData proto instance with the action source initialized to
       HUMAN_DEMONSTRATION so that valid training data is generated.
     """
-    action_data = action_pb2.ActionData()
-    action_data.source = action_pb2.ActionData.ActionSource.HUMAN_DEMONSTRATION
-    return action_data
+    return action_pb2.ActionData(
+        source=action_pb2.ActionData.ActionSource.HUMAN_DEMONSTRATION)
 
   @staticmethod
   def _add_to_action_data_proto(data_proto, child_data_proto, unused_node):
@@ -66,13 +52,18 @@ class DataProtobufGenerator:
       data_proto: ActionData proto to add child message to.
       child_data_proto: Child message to add to data_proto.
       unused_node: Unused.
+
+    Raises:
+      TypeError: If child_data_proto is not a supported action type.
     """
-    action = data_proto.actions.add()
-    child_data_proto_type = type(child_data_proto)
-    field_name = DataProtobufGenerator._LEAF_DATA_PROTO_CLASS_TO_FIELD_NAME.get(
-        child_data_proto_type)
-    assert field_name, f'Unsupported action data type {child_data_proto_type}'
-    getattr(action, field_name).CopyFrom(child_data_proto)
+    child_data_proto_type = child_data_proto.__class__
+    try:
+      copy_to_field = _LEAF_DATA_PROTO_CLASS_TO_COPY_METHOD[
+          child_data_proto_type]
+    except KeyError:
+      raise TypeError(
+          f'Unsupported action data type {child_data_proto_type}') from None
+    copy_to_field(data_proto.actions.add(), child_data_proto)
 
   @staticmethod
   def _create_category_proto(unused_spec_proto):
@@ -84,9 +75,8 @@ class DataProtobufGenerator:
     Returns:
       Category proto instance with a value of 0.
     """
-    category = primitives_pb2.Category()
-    category.value = 0
-    return category
+    # Proto3 scalars default to 0 so there is no need to set the value.
+    return primitives_pb2.Category()
 
   @staticmethod
   def _create_number_proto(spec_proto):
@@ -98,9 +88,7 @@ class DataProtobufGenerator:
     Returns:
       Number proto instance set to the minimum value in the spec.
     """
-    number = primitives_pb2.Number()
-    number.value = spec_proto.minimum
-    return number
+    return primitives_pb2.Number(value=spec_proto.minimum)
 
   @staticmethod
   def _create_joystick_proto(unused_spec_proto):
@@ -112,10 +100,7 @@ class DataProtobufGenerator:
     Returns:
       Joystick proto with a neutral (origin) position.
     """
-    joystick = action_pb2.Joystick()
-    joystick.x_axis = 0.0
-    joystick.y_axis = 0.0
-    return joystick
+    return action_pb2.Joystick()
 
   @staticmethod
   def _create_position_proto(unused_spec_proto):
@@ -127,11 +112,7 @@ class DataProtobufGenerator:
     Returns:
       Position proto at the origin.
     """
-    position = primitives_pb2.Position()
-    position.x = 0.0
-    position.y = 0.0
-    position.z = 0.0
-    return position
+    return primitives_pb2.Position()
 
   @staticmethod
   def _create_rotation_proto(unused_spec_proto):
@@ -143,12 +124,7 @@ class DataProtobufGenerator:
     Returns:
       Identity Rotation proto.
     """
-    rotation = primitives_pb2.Rotation()
-    rotation.x = 0.0
-    rotation.y = 0.0
-    rotation.z = 0.0
-    rotation.w = 1.0
-    return rotation
+    return primitives_pb2.Rotation(w=1.0)
 
   @staticmethod
   def _create_observation_data_proto(unused_spec_proto):
@@ -171,10 +147,9 @@ class DataProtobufGenerator:
       child_data_proto: Child message to add to data_proto.
       node: ProtobufNode instance that references the spec of child_data_proto.
     """
-    if node.name == 'player':
-      data_proto.player.CopyFrom(child_data_proto)
-    elif node.name == 'camera':
-      data_proto.camera.CopyFrom(child_data_proto)
+    copy_to_field = _OBSERVATION_ENTITY_NAME_TO_COPY_METHOD.get(node.name)
+    if copy_to_field:
+      copy_to_field(data_proto, child_data_proto)
     else:
       data_proto.global_entities.append(child_data_proto)
 
@@ -198,21 +173,23 @@ class DataProtobufGenerator:
       data_proto: Proto to add child message to.
       child_data_proto: Child message to add to data_proto.
       unused_node: Unused.
+
+    Raises:
+      TypeError: If child_data_proto is not a supported entity field type.
     """
-    child_data_proto_type = type(child_data_proto)
-    field_name = (
-        DataProtobufGenerator._ENTITY_DATA_PROTO_CLASS_TO_FIELD_NAME.get(
-            child_data_proto_type))
-    if field_name:
-      getattr(data_proto, field_name).CopyFrom(child_data_proto)
+    child_data_proto_type = child_data_proto.__class__
+    copy_to_field = _ENTITY_DATA_PROTO_CLASS_TO_COPY_METHOD.get(
+        child_data_proto_type)
+    if copy_to_field:
+      copy_to_field(data_proto, child_data_proto)
     else:
-      entity_field = data_proto.entity_fields.add()
-      field_name = (
-          DataProtobufGenerator._LEAF_DATA_PROTO_CLASS_TO_FIELD_NAME.get(
-              child_data_proto_type))
-      assert field_name, ('Unsupported entity field type ' +
-                          str(child_data_proto_type))
-      getattr(entity_field, field_name).CopyFrom(child_data_proto)
+      try:
+        copy_to_field = _LEAF_DATA_PROTO_CLASS_TO_COPY_METHOD[
+            child_data_proto_type]
+      except KeyError:
+        raise TypeError(
+            f'Unsupported entity field type {child_data_proto_type}') from None
+      copy_to_field(data_proto.entity_fields.add(), child_data_proto)
 
   @staticmethod
   def _create_feeler_proto(spec_proto):
@@ -224,17 +201,14 @@ class DataProtobufGenerator:
     Returns:
       Feeler proto that conforms to the spec.
     """
+    # Build a single measurement and copy it for each feeler.
+    measurement = observation_pb2.FeelerMeasurement()
+    measurement.distance.value = spec_proto.distance.minimum
+    measurement.experimental_data.extend(
+        [primitives_pb2.Number(value=number.minimum)
+         for number in spec_proto.experimental_data])
     feeler = observation_pb2.Feeler()
-    number_of_feelers = spec_proto.count
-    minimum_distance = spec_proto.distance.minimum
-    minimum_experimental_data = [
-        number.minimum for number in spec_proto.experimental_data]
-    for _ in range(number_of_feelers):
-      measurement = feeler.measurements.add()
-      measurement.distance.value = minimum_distance
-      for minimum in minimum_experimental_data:
-        number = measurement.experimental_data.add()
-        number.value = minimum
+    feeler.measurements.extend([measurement] * spec_proto.count)
     return feeler
 
   @staticmethod
@@ -255,8 +229,9 @@ class DataProtobufGenerator:
       data_proto: Category protobuf to modify.
       spec_proto: Spec protobuf for the data.
     """
-    data_proto.value = random.randrange(
-        0, max(0, len(spec_proto.enum_values) - 1))
+    number_of_values = len(spec_proto.enum_values)
+    data_proto.value = (
+        _randrange(number_of_values) if number_of_values > 1 else 0)
 
   @staticmethod
   def _randomize_number_proto(data_proto, spec_proto):
@@ -266,12 +241,7 @@ class DataProtobufGenerator:
       data_proto: Number protobuf to modify.
       spec_proto: Spec protobuf for the data.
     """
-    data_proto.value = random.uniform(spec_proto.minimum, spec_proto.maximum)
-
-  @staticmethod
-  def _random_axis_value():
-    """Generate a random value between -1.0...1.0."""
-    return random.uniform(-1.0, 1.0)
+    data_proto.value = _uniform(spec_proto.minimum, spec_proto.maximum)
 
   @staticmethod
   def _randomize_joystick_proto(data_proto, unused_spec_proto):
@@ -281,8 +251,8 @@ class DataProtobufGenerator:
       data_proto: Number protobuf to modify.
       unused_spec_proto: Unused.
     """
-    data_proto.x_axis = DataProtobufGenerator._random_axis_value()
-    data_proto.y_axis = DataProtobufGenerator._random_axis_value()
+    data_proto.x_axis = _uniform(-1.0, 1.0)
+    data_proto.y_axis = _uniform(-1.0, 1.0)
 
   @staticmethod
   def _randomize_position_proto(data_proto, unused_spec_proto):
@@ -292,9 +262,9 @@ class DataProtobufGenerator:
       data_proto: Position protobuf to modify.
       unused_spec_proto: Spec protobuf for the data.
     """
-    data_proto.x = DataProtobufGenerator._random_axis_value()
-    data_proto.y = DataProtobufGenerator._random_axis_value()
-    data_proto.z = DataProtobufGenerator._random_axis_value()
+    data_proto.x = _uniform(-1.0, 1.0)
+    data_proto.y = _uniform(-1.0, 1.0)
+    data_proto.z = _uniform(-1.0, 1.0)
 
   @staticmethod
   def _randomize_rotation_proto(data_proto, unused_spec_proto):
@@ -304,10 +274,10 @@ class DataProtobufGenerator:
       data_proto: Rotation protobuf to modify.
       unused_spec_proto: Spec protobuf for the data.
     """
-    data_proto.x = DataProtobufGenerator._random_axis_value()
-    data_proto.y = DataProtobufGenerator._random_axis_value()
-    data_proto.z = DataProtobufGenerator._random_axis_value()
-    data_proto.w = DataProtobufGenerator._random_axis_value()
+    data_proto.x = _uniform(-1.0, 1.0)
+    data_proto.y = _uniform(-1.0, 1.0)
+    data_proto.z = _uniform(-1.0, 1.0)
+    data_proto.w = _uniform(-1.0, 1.0)
 
   @staticmethod
   def _randomize_feeler_proto(data_proto, spec_proto):
@@ -317,14 +287,25 @@ class DataProtobufGenerator:
       data_proto: Feeler protobuf to modify.
       spec_proto: Spec protobuf for the data.
     """
-    experimental_data_count = len(spec_proto.experimental_data)
-    for measurement in data_proto.measurements:
-      DataProtobufGenerator._randomize_number_proto(
-          measurement.distance, spec_proto.distance)
-      for i in range(experimental_data_count):
-        DataProtobufGenerator._randomize_number_proto(
-            measurement.experimental_data[i],
-            spec_proto.experimental_data[i])
+    number_specs = [spec_proto.distance]
+    number_specs.extend(spec_proto.experimental_data)
+    measurements = data_proto.measurements
+    # Draw values for all measurements at once then assign them to each field.
+    values = np.random.uniform(
+        low=[number.minimum for number in number_specs],
+        high=[number.maximum for number in number_specs],
+        size=(len(measurements), len(number_specs))).tolist()
+    if not spec_proto.experimental_data:
+      # Only distances need to be set.
+      for measurement, (distance,) in zip(measurements, values):
+        measurement.distance.value = distance
+      return
+    for measurement, (distance, *experimental_values) in zip(measurements,
+                                                            values):
+      measurement.distance.value = distance
+      for number, value in zip(measurement.experimental_data,
+                               experimental_values):
+        number.value = value
 
   @staticmethod
   def randomize_leaf_data_proto(data_proto, spec_proto):
@@ -336,31 +317,100 @@ class DataProtobufGenerator:
       data_proto: Leaf data protobuf to modify.
       spec_proto: Spec protobuf for the data.
     """
-    if not DataProtobufGenerator._DATA_PROTO_CLASS_TO_RANDOMIZE_METHOD:
-      DataProtobufGenerator._DATA_PROTO_CLASS_TO_RANDOMIZE_METHOD = {
-          action_pb2.ActionData: DataProtobufGenerator._null_modify_data_proto,
-          action_pb2.Joystick: DataProtobufGenerator._randomize_joystick_proto,
-          observation_pb2.Entity: DataProtobufGenerator._null_modify_data_proto,
-          observation_pb2.Feeler: DataProtobufGenerator._randomize_feeler_proto,
-          observation_pb2.ObservationData: (
-              DataProtobufGenerator._null_modify_data_proto),
-          primitives_pb2.Category: (
-              DataProtobufGenerator._randomize_category_proto),
-          primitives_pb2.Number: DataProtobufGenerator._randomize_number_proto,
-          primitives_pb2.Position: (
-              DataProtobufGenerator._randomize_position_proto),
-          primitives_pb2.Rotation: (
-              DataProtobufGenerator._randomize_rotation_proto),
-      }
-    randomize_method = (
-        DataProtobufGenerator._DATA_PROTO_CLASS_TO_RANDOMIZE_METHOD.get(
-            type(data_proto)))
-    randomize_method(data_proto, spec_proto)
+    _DATA_PROTO_CLASS_TO_RANDOMIZE_METHOD[data_proto.__class__](
+        data_proto, spec_proto)
+
+  @staticmethod
+  def generator_from_spec_node(node):
+    """Create a function that generates data protos from a tree of spec nodes.
+
+    The tree is traversed once when this method is called so the returned
+    function can be used to generate many data protos from the same spec
+    without walking the tree or looking up methods for each node.
+
+    Args:
+      node: ProtobufNode instance that references a spec proto to
+        traverse to produce a data protobuf.
+
+    Returns:
+      Callable that takes an optional modify_data_proto argument, see
+      from_spec_node(), and returns a list of newly generated data protos in
+      the same form as from_spec_node().
+    """
+    get_create_and_add_methods = _SPEC_PROTO_CLASS_TO_CREATE_ADD_METHODS.get
+
+    # Flatten the tree with a pre-order traversal. Each entry of plan is a
+    # (spec_proto, create_data_proto, add_to_data_proto, children) tuple where
+    # children is a list of (child_index, child_node) tuples that reference
+    # the entries of the node's children.
+    plan = []
+    # Stack of (node, parent_index) tuples where parent_index references the
+    # entry of the node's parent in plan.
+    pending = [(node, None)]
+    while pending:
+      current_node, parent_index = pending.pop()
+      spec_proto = current_node.proto
+      # Any node without create / add methods is a repeated message
+      # container, as every other spec proto class is in the dispatch table,
+      # so there is no need to probe the proto for an add() method. Protos
+      # generated from the children of a container are forwarded to the
+      # parent.
+      create_data_proto, add_to_data_proto = get_create_and_add_methods(
+          spec_proto.__class__, (None, None))
+      index = len(plan)
+      plan.append((spec_proto, create_data_proto, add_to_data_proto, []))
+      if parent_index is not None:
+        plan[parent_index][3].append((index, current_node))
+      # Push children in reverse so that they're visited in order.
+      pending.extend((child_node, index)
+                     for child_node in reversed(current_node.children))
+    reverse_plan = tuple(reversed(list(enumerate(plan))))
+
+    def generate(modify_data_proto=None):
+      """Generate data protos from the spec.
+
+      Args:
+        modify_data_proto: See from_spec_node().
+
+      Returns:
+        See from_spec_node().
+      """
+      # Protos generated from each node are held in tuples as they're never
+      # modified, only the result is returned as a list.
+      data_protos_by_index = [None] * len(plan)
+      # Create data protos in the same order the tree is traversed.
+      for index, (spec_proto, create_data_proto, _, _) in enumerate(plan):
+        if create_data_proto:
+          data_proto = create_data_proto(spec_proto)
+          if modify_data_proto:
+            modify_data_proto(data_proto, spec_proto)
+          data_protos_by_index[index] = (data_proto,)
+
+      # Children are always visited after their parent so add data protos to
+      # their containers in reverse order to complete each child before it's
+      # copied into its parent.
+      for index, (_, create_data_proto, add_to_data_proto,
+                  children) in reverse_plan:
+        if create_data_proto:
+          data_proto = data_protos_by_index[index][0]
+          for child_index, child_node in children:
+            for child_data_proto in data_protos_by_index[child_index]:
+              add_to_data_proto(data_proto, child_data_proto, child_node)
+        else:
+          data_protos_by_index[index] = tuple(
+              child_data_proto for child_index, _ in children
+              for child_data_proto in data_protos_by_index[child_index])
+      return list(data_protos_by_index[0])
+
+    return generate
 
   @staticmethod
   def from_spec_node(node, modify_data_proto=None):
     """Traverse a tree of protobuf spec nodes, generating data protos.
 
+    To generate data protos from the same spec more than once use
+    generator_from_spec_node() instead.
+
     Args:
       node: ProtobufNode instance that references a spec proto to
         traverse to produce a data protobuf.
@@ -378,56 +428,79 @@ class DataProtobufGenerator:
       ObservationSpec.global_entities, this method will return a list of Entity
       protos for each entity specified by the field.
     """
-    modify_data_proto = (modify_data_proto if modify_data_proto else
-                         DataProtobufGenerator._null_modify_data_proto)
-    if not DataProtobufGenerator._SPEC_PROTO_CLASS_TO_CREATE_ADD_METHODS:
-      DataProtobufGenerator._SPEC_PROTO_CLASS_TO_CREATE_ADD_METHODS = {
-          action_pb2.ActionSpec: (
-              DataProtobufGenerator._create_action_data_proto,
-              DataProtobufGenerator._add_to_action_data_proto),
-          action_pb2.JoystickType: (
-              DataProtobufGenerator._create_joystick_proto, None),
-          observation_pb2.EntityType: (
-              DataProtobufGenerator._create_entity_proto,
-              DataProtobufGenerator._add_to_entity_proto),
-          observation_pb2.FeelerType: (
-              DataProtobufGenerator._create_feeler_proto, None),
-          observation_pb2.ObservationSpec: (
-              DataProtobufGenerator._create_observation_data_proto,
-              DataProtobufGenerator._add_to_observation_data_proto),
-          primitives_pb2.CategoryType: (
-              DataProtobufGenerator._create_category_proto, None),
-          primitives_pb2.NumberType: (
-              DataProtobufGenerator._create_number_proto, None),
-          primitives_pb2.PositionType: (
-              DataProtobufGenerator._create_position_proto, None),
-          primitives_pb2.RotationType: (
-              DataProtobufGenerator._create_rotation_proto, None),
-      }
-
-    create_and_add_methods = (
-        DataProtobufGenerator._SPEC_PROTO_CLASS_TO_CREATE_ADD_METHODS.get(
-            type(node.proto)))
-    data_protos = []
-    # If this isn't a repeated message container, create the container proto.
-    if create_and_add_methods:
-      create_data_proto, add_to_data_proto = create_and_add_methods
-      container_data_proto = create_data_proto(node.proto)
-      modify_data_proto(container_data_proto, node.proto)
-      data_protos.append(container_data_proto)
-    # The class for a repeated message container isn't public so detect via
-    # the add() method.
-    elif hasattr(node.proto, 'add') and callable(getattr(node.proto, 'add')):
-      # Just return a list of child protos if this is a repeated message
-      # container.
-      container_data_proto = None
-
-    for child_node in node.children:
-      child_data_protos = DataProtobufGenerator.from_spec_node(
-          child_node, modify_data_proto=modify_data_proto)
-      if container_data_proto:
-        for child_data_proto in child_data_protos:
-          add_to_data_proto(container_data_proto, child_data_proto, child_node)
-      else:
-        data_protos.extend(child_data_protos)
-    return data_protos
+    return DataProtobufGenerator.generator_from_spec_node(node)(
+        modify_data_proto=modify_data_proto)
+
+
+# Used by _add_to_action_data_proto() and _add_to_entity_proto() to copy a
+# data leaf proto to the associated field of an Action or EntityField proto.
+_LEAF_DATA_PROTO_CLASS_TO_COPY_METHOD = {
+    primitives_pb2.Category: lambda parent, child: (
+        parent.category.CopyFrom(child)),
+    primitives_pb2.Number: lambda parent, child: parent.number.CopyFrom(child),
+    action_pb2.Joystick: lambda parent, child: (
+        parent.joystick.CopyFrom(child)),
+    observation_pb2.Feeler: lambda parent, child: parent.feeler.CopyFrom(child),
+}
+
+# Used by _add_to_entity_proto() to copy a data proto to the associated field
+# of an Entity proto.
+_ENTITY_DATA_PROTO_CLASS_TO_COPY_METHOD = {
+    primitives_pb2.Position: lambda parent, child: (
+        parent.position.CopyFrom(child)),
+    primitives_pb2.Rotation: lambda parent, child: (
+        parent.rotation.CopyFrom(child)),
+}
+
+# Used by _add_to_observation_data_proto() to copy an Entity proto to the
+# ObservationData field with the same name as the entity's spec node. Entities
+# not in this map are global entities.
+_OBSERVATION_ENTITY_NAME_TO_COPY_METHOD = {
+    'player': lambda parent, child: parent.player.CopyFrom(child),
+    'camera': lambda parent, child: parent.camera.CopyFrom(child),
+}
+
+# Maps spec proto classes to (create, add) methods used by from_spec_node()
+# where create is a method that creates a data proto from a spec proto and
+# add is a method that adds a child data proto to the created data proto or
+# None if the data proto is a leaf.
+# pylint: disable=protected-access
+_SPEC_PROTO_CLASS_TO_CREATE_ADD_METHODS = {
+    action_pb2.ActionSpec: (
+        DataProtobufGenerator._create_action_data_proto,
+        DataProtobufGenerator._add_to_action_data_proto),
+    action_pb2.JoystickType: (
+        DataProtobufGenerator._create_joystick_proto, None),
+    observation_pb2.EntityType: (
+        DataProtobufGenerator._create_entity_proto,
+        DataProtobufGenerator._add_to_entity_proto),
+    observation_pb2.FeelerType: (
+        DataProtobufGenerator._create_feeler_proto, None),
+    observation_pb2.ObservationSpec: (
+        DataProtobufGenerator._create_observation_data_proto,
+        DataProtobufGenerator._add_to_observation_data_proto),
+    primitives_pb2.CategoryType: (
+        DataProtobufGenerator._create_category_proto, None),
+    primitives_pb2.NumberType: (
+        DataProtobufGenerator._create_number_proto, None),
+    primitives_pb2.PositionType: (
+        DataProtobufGenerator._create_position_proto, None),
+    primitives_pb2.RotationType: (
+        DataProtobufGenerator._create_rotation_proto, None),
+}
+
+# Maps data proto classes to methods used by randomize_leaf_data_proto() to
+# randomize the contents of the proto.
+_DATA_PROTO_CLASS_TO_RANDOMIZE_METHOD = {
+    action_pb2.ActionData: DataProtobufGenerator._null_modify_data_proto,
+    action_pb2.Joystick: DataProtobufGenerator._randomize_joystick_proto,
+    observation_pb2.Entity: DataProtobufGenerator._null_modify_data_proto,
+    observation_pb2.Feeler: DataProtobufGenerator._randomize_feeler_proto,
+    observation_pb2.ObservationData: (
+        DataProtobufGenerator._null_modify_data_proto),
+    primitives_pb2.Category: DataProtobufGenerator._randomize_category_proto,
+    primitives_pb2.Number: DataProtobufGenerator._randomize_number_proto,
+    primitives_pb2.Position: DataProtobufGenerator._randomize_position_proto,
+    primitives_pb2.Rotation: DataProtobufGenerator._randomize_rotation_proto,
+}
+# pylint: enable=protected-access
@@ -138,6 +138,37 @@ class DataProtobufGeneratorTest(absltest.TestCase):
                       expected)
     self.assertCountEqual(data_protos, [expected])
 
+  def test_generator_from_spec_node(self):
+    """Test generating multiple ObservationData protos from a spec."""
+    spec = observation_pb2.ObservationSpec()
+    text_format.Parse(specs_test._OBSERVATION_SPEC, spec)
+    generate = (
+        data_protobuf_generator.DataProtobufGenerator.generator_from_spec_node(
+            specs.ProtobufNode.from_spec(spec)))
+
+    expected = observation_pb2.ObservationData()
+    text_format.Parse(DataProtobufGeneratorTest._GENERATED_OBSERVATION_DATA,
+                      expected)
+    first_data_protos = generate()
+    second_data_protos = generate()
+    self.assertCountEqual(first_data_protos, [expected])
+    self.assertCountEqual(second_data_protos, [expected])
+    self.assertIsNot(first_data_protos[0], second_data_protos[0])
+
+  def test_add_unsupported_type_to_action_data(self):
+    """Ensure adding an unsupported proto to ActionData raises TypeError."""
+    with self.assertRaises(TypeError):
+      # pylint: disable=protected-access
+      data_protobuf_generator.DataProtobufGenerator._add_to_action_data_proto(
+          action_pb2.ActionData(), primitives_pb2.Position(), None)
+
+  def test_add_unsupported_type_to_entity(self):
+    """Ensure adding an unsupported proto to an Entity raises TypeError."""
+    with self.assertRaises(TypeError):
+      # pylint: disable=protected-access
+      data_protobuf_generator.DataProtobufGenerator._add_to_entity_proto(
+          observation_pb2.Entity(), action_pb2.ActionData(), None)
+
   def test_observation_from_spec_calls_modify_data_proto(self):
     """Ensure modify_data_proto is called for each observation data proto."""
     modified = []  # List of modified (type(data_proto), spec_proto) tuples.
@@ -234,6 +265,15 @@ class DataProtobufGeneratorTest(absltest.TestCase):
       self._assert_between(data.value, 0, len(spec.enum_values) - 1)
     self.assertGreater(len(unique_values), 1)
 
+  def test_randomize_single_value_category_proto(self):
+    """Randomize a Category proto with a single value."""
+    spec = primitives_pb2.CategoryType()
+    spec.enum_values.append('only')
+    data = primitives_pb2.Category()
+    data_protobuf_generator.DataProtobufGenerator.randomize_leaf_data_proto(
+        data, spec)
+    self.assertEqual(data.value, 0)
+
   def test_randomize_number_proto(self):
     """Randomize a Number proto."""
     spec = primitives_pb2.NumberType()
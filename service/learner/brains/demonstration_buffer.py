@@ -15,8 +15,8 @@
 """Collects falken demo steps and returns tf_agents trajectories."""
 
 # pylint: disable=g-bad-import-order
-import collections
 import enum
+import zlib
 
 import numpy as np
 import tensorflow as tf
@@ -27,6 +27,7 @@ from tf_agents.trajectories import trajectory
 
 import common.generate_protos  # pylint: disable=unused-import
 import action_pb2
+import observation_pb2
 
 
 class StepPhase(enum.Enum):
@@ -43,40 +44,93 @@ class StepPhase(enum.Enum):
 _END_STEP_PHASES = frozenset((StepPhase.SUCCESS, StepPhase.FAILURE,
                               StepPhase.ABORTED, StepPhase.GAVE_UP))
 
+# Bit mask of the values of _END_STEP_PHASES. Testing a bit is cheaper than
+# hashing an enum to look it up in a set.
+_END_STEP_PHASE_VALUE_MASK = sum(
+    1 << phase.value for phase in _END_STEP_PHASES)
 
-def _is_episode_end(step_phase):
+
+_START_PHASE_VALUE = StepPhase.START.value
+_ABORTED_PHASE_VALUE = StepPhase.ABORTED.value
+
+# Action source of steps that are converted to trajectories. Enum fields of
+# protos are ints so this is compared directly with ActionData.source.
+_HUMAN_DEMONSTRATION = int(action_pb2.ActionData.HUMAN_DEMONSTRATION)
+
+# float32 rewards and discounts shared by time steps.
+_DISCOUNT_ONE = np.float32(1.0)
+_DISCOUNT_ZERO = np.float32(0.0)
+_REWARD_ZERO = np.float32(0.0)
+
+# Number of steps initially allocated for the columns of each episode.
+_INITIAL_EPISODE_CAPACITY = 64
+
+# Maximum number of episode columns kept for reuse by DemonstrationBuffer.
+_MAX_FREE_EPISODES = 16
+
+# zlib compression level used for buffered protos, favoring speed over size.
+_COMPRESSION_LEVEL = 1
+
+# Sentinel episode ID used when DemonstrationBuffer has no cached episode. This
+# can't be None as None is a valid episode ID.
+_NO_EPISODE = object()
+
+
+def _is_episode_end(phase_value):
   """Determine whether the specified phase is the end of an episode.
 
   Args:
-    step_phase: StepPhase to query.
+    phase_value: Value of the StepPhase to query.
 
   Returns:
     A Boolean indicating whether the phase signifies the end of an episode.
   """
-  return step_phase in _END_STEP_PHASES
-
-
-class Step(
-    collections.namedtuple(
-        'Step',
-        ','.join([
-            'observation_pb',
-            'reward',
-            'phase',
-            'episode_id',
-            'action_pb',
-            'timestamp_micros']))):
+  return bool((_END_STEP_PHASE_VALUE_MASK >> phase_value) & 1)
+
+
+class Step:
   """Represents data associated with a falken step at a specific time.
 
   Attributes:
     episode_id: Id for the episode that's collecting this step.
     phase: The phase of the episode this step represents.
+    phase_value: Value of phase. The buffer only operates on this int so
+      that it doesn't access the enum for each step.
     observation_pb: The observation data for this step.
     action_pb: Action data from brain or user.
     reward: The reward for this step.
     timestamp_micros: Microsecond timestamp of the step.
   """
 
+  # A Step is created for each frame so store attributes in slots rather than
+  # a per-instance dictionary.
+  __slots__ = ('observation_pb', 'reward', 'phase', 'phase_value',
+               'episode_id', 'action_pb', 'timestamp_micros')
+
+  def __init__(self, observation_pb, reward, phase, episode_id, action_pb,
+               timestamp_micros):
+    """Initialize the step.
+
+    Args:
+      observation_pb: The observation data for this step.
+      reward: The reward for this step.
+      phase: The phase of the episode this step represents.
+      episode_id: Id for the episode that's collecting this step.
+      action_pb: Action data from brain or user.
+      timestamp_micros: Microsecond timestamp of the step.
+    """
+    self.observation_pb = observation_pb
+    self.reward = reward
+    self.phase = phase
+    self.phase_value = phase.value
+    self.episode_id = episode_id
+    self.action_pb = action_pb
+    self.timestamp_micros = timestamp_micros
+
+  def __repr__(self):
+    return (f'Step(episode_id={self.episode_id!r}, phase={self.phase}, '
+            f'reward={self.reward}, timestamp_micros={self.timestamp_micros})')
+
   def get_time_step(self, observation_spec):
     """Extract TFA time_step from step.
 
@@ -91,20 +145,8 @@ class Step(
     # Converts incoming observations into TFA format
     tfa_observation = observation_spec.tfa_value(self.observation_pb)
 
-    reward = np.array(self.reward, dtype=np.float32)
-    discount = np.array(1.0, dtype=np.float32)
-
-    if self.phase == StepPhase.START:
-      time_step = ts.restart(tfa_observation)
-    elif self.phase == StepPhase.SUCCESS or self.phase == StepPhase.ABORTED:
-      time_step = ts.termination(tfa_observation, reward=reward)
-    elif self.phase == StepPhase.ABORTED:
-      time_step = ts.truncation(
-          tfa_observation, reward=reward, discount=discount)
-    else:
-      time_step = ts.transition(
-          tfa_observation, reward=reward, discount=discount)
-    return time_step
+    return _time_step(self.phase_value, tfa_observation,
+                      np.float32(self.reward), _DISCOUNT_ONE)
 
   def get_action_step(self, action_spec):
     """Extract TFA action_step from step.
@@ -119,6 +161,275 @@ class Step(
         self.action_pb))
 
 
+def _time_step(phase_value, tfa_observation, reward, discount):
+  """Create a TFA time_step for a step.
+
+  Args:
+    phase_value: Value of the StepPhase of the step.
+    tfa_observation: Observation of the step in TFA format.
+    reward: float32 reward of the step.
+    discount: float32 discount of the step.
+
+  Returns:
+    tf_agents TimeStep object.
+  """
+  return _PHASE_VALUE_TO_TIME_STEP_FACTORY.get(phase_value, ts.transition)(
+      tfa_observation, reward, discount)
+
+
+def _restart(tfa_observation, unused_reward, unused_discount):
+  """Create a TFA time_step for the first step of an episode.
+
+  Args:
+    tfa_observation: Observation of the step in TFA format.
+    unused_reward: Ignored, the first step of an episode has no reward.
+    unused_discount: Ignored, the first step of an episode is not discounted.
+
+  Returns:
+    tf_agents TimeStep object.
+  """
+  return ts.restart(tfa_observation)
+
+
+def _termination(tfa_observation, reward, unused_discount):
+  """Create a TFA time_step for a step that terminates an episode.
+
+  Args:
+    tfa_observation: Observation of the step in TFA format.
+    reward: float32 reward of the step.
+    unused_discount: Ignored, the discount of a terminal step is 0.
+
+  Returns:
+    tf_agents TimeStep object.
+  """
+  return ts.termination(tfa_observation, reward)
+
+
+def _phase_value_table(phase_to_value, default_value, dtype):
+  """Create an array that maps StepPhase values to values.
+
+  Args:
+    phase_to_value: Dictionary that maps StepPhase instances to values.
+    default_value: Value of phases that are not in phase_to_value.
+    dtype: Type of the array.
+
+  Returns:
+    Numpy array indexed by StepPhase value.
+  """
+  table = np.full((max(phase.value for phase in StepPhase) + 1,),
+                  default_value, dtype=dtype)
+  for phase, value in phase_to_value.items():
+    table[phase.value] = value
+  return table
+
+
+# Maps StepPhase values to functions that create a TFA time_step from the
+# observation, reward and discount of a step. Steps in any other phase are
+# transitions.
+_PHASE_VALUE_TO_TIME_STEP_FACTORY = {
+    StepPhase.START.value: _restart,
+    StepPhase.SUCCESS.value: _termination,
+    StepPhase.FAILURE.value: _termination,
+    StepPhase.GAVE_UP.value: _termination,
+    StepPhase.ABORTED.value: ts.truncation,
+}
+
+# Step type and discount of the time_step created for each StepPhase value.
+_PHASE_VALUE_TO_STEP_TYPE = _phase_value_table({
+    StepPhase.START: ts.StepType.FIRST,
+    StepPhase.SUCCESS: ts.StepType.LAST,
+    StepPhase.FAILURE: ts.StepType.LAST,
+    StepPhase.GAVE_UP: ts.StepType.LAST,
+    StepPhase.ABORTED: ts.StepType.LAST,
+}, ts.StepType.MID, np.int32)
+_PHASE_VALUE_TO_DISCOUNT = _phase_value_table({
+    StepPhase.SUCCESS: _DISCOUNT_ZERO,
+    StepPhase.FAILURE: _DISCOUNT_ZERO,
+    StepPhase.GAVE_UP: _DISCOUNT_ZERO,
+}, _DISCOUNT_ONE, np.float32)
+
+
+def _compress_protos(protos):
+  """Serialize and compress a list of protos.
+
+  Args:
+    protos: List of protos to compress.
+
+  Returns:
+    (compressed_data, sizes) tuple where compressed_data is the zlib
+    compressed concatenation of the serialized protos and sizes is a list of
+    the size of each serialized proto.
+  """
+  serialized_protos = [proto.SerializeToString() for proto in protos]
+  return (zlib.compress(b''.join(serialized_protos), _COMPRESSION_LEVEL),
+          [len(serialized_proto) for serialized_proto in serialized_protos])
+
+
+def _decompress_protos(compressed_protos, proto_class):
+  """Decompress and parse protos compressed by _compress_protos().
+
+  Args:
+    compressed_protos: (compressed_data, sizes) tuple returned by
+      _compress_protos().
+    proto_class: Class of the compressed protos.
+
+  Returns:
+    List of protos.
+  """
+  compressed_data, sizes = compressed_protos
+  data = zlib.decompress(compressed_data)
+  protos = []
+  offset = 0
+  for size in sizes:
+    protos.append(proto_class.FromString(data[offset:offset + size]))
+    offset += size
+  return protos
+
+
+class _EpisodeColumns:
+  """Stores the human demonstration steps of an episode as columns.
+
+  Rather than keeping a Step instance per frame, the scalar fields of each
+  step are stored in pre-allocated numpy arrays, which double in size when
+  full, and the observation and action protos are stored in lists.
+
+  To bound the memory used by long episodes, protos can optionally be
+  serialized and compressed in chunks as they're recorded. decompress() must
+  be called to restore all protos before they're read.
+  """
+
+  __slots__ = ('_size', '_rewards', '_phases', '_timestamps_micros',
+               'observation_pbs', 'action_pbs', '_compress_threshold',
+               '_compressed_chunks')
+
+  def __init__(self, capacity=_INITIAL_EPISODE_CAPACITY,
+               compress_threshold=None):
+    """Initialize the columns.
+
+    Args:
+      capacity: Number of steps to allocate space for.
+      compress_threshold: If set, the number of recorded protos of each type
+        that are compressed into a chunk once they're buffered.
+    """
+    self._size = 0
+    self._rewards = np.empty((capacity,), dtype=np.float32)
+    self._phases = np.empty((capacity,), dtype=np.int8)
+    self._timestamps_micros = np.empty((capacity,), dtype=np.int64)
+    self.observation_pbs = []
+    self.action_pbs = []
+    self._compress_threshold = compress_threshold
+    # List of (observations, actions) tuples where each element is a chunk
+    # of protos compressed by _compress_protos().
+    self._compressed_chunks = []
+
+  @staticmethod
+  def from_steps(steps):
+    """Create columns from steps.
+
+    Args:
+      steps: Iterable of Step instances.
+
+    Returns:
+      _EpisodeColumns instance that contains the human demonstration steps.
+    """
+    # Filter the steps up front so that each column is filled in one pass
+    # without growing. np.fromiter() writes each value directly into the
+    # column rather than building an intermediate list.
+    demo_steps = [
+        step for step in steps
+        if step.action_pb.source == _HUMAN_DEMONSTRATION]
+    size = len(demo_steps)
+    columns = _EpisodeColumns(capacity=0)
+    columns._size = size
+    columns._rewards = np.fromiter(
+        (step.reward for step in demo_steps), dtype=np.float32, count=size)
+    columns._phases = np.fromiter(
+        (step.phase_value for step in demo_steps), dtype=np.int8, count=size)
+    columns._timestamps_micros = np.fromiter(
+        (step.timestamp_micros for step in demo_steps), dtype=np.int64,
+        count=size)
+    columns.observation_pbs = [step.observation_pb for step in demo_steps]
+    columns.action_pbs = [step.action_pb for step in demo_steps]
+    return columns
+
+  def __len__(self):
+    return self._size
+
+  def reset(self):
+    """Remove all steps while retaining the capacity of the numpy columns."""
+    self._size = 0
+    self.observation_pbs = []
+    self.action_pbs = []
+    self._compressed_chunks = []
+
+  @property
+  def rewards(self):
+    """float32 numpy array of the reward of each step."""
+    return self._rewards[:self._size]
+
+  @property
+  def phases(self):
+    """int8 numpy array of the StepPhase value of each step."""
+    return self._phases[:self._size]
+
+  @property
+  def timestamps_micros(self):
+    """int64 numpy array of the timestamp of each step."""
+    return self._timestamps_micros[:self._size]
+
+  def _grow(self):
+    """Double the capacity of the numpy columns."""
+    size = self._size
+    capacity = max(1, 2 * len(self._rewards))
+    for attribute in ('_rewards', '_phases', '_timestamps_micros'):
+      column = getattr(self, attribute)
+      grown_column = np.empty((capacity,), dtype=column.dtype)
+      grown_column[:size] = column[:size]
+      setattr(self, attribute, grown_column)
+
+  def record_step(self, step):
+    """Append a step to the columns if it's a human demonstration.
+
+    Args:
+      step: Step instance.
+    """
+    if step.action_pb.source != _HUMAN_DEMONSTRATION:
+      # Ignore non-demo frames
+      return
+    size = self._size
+    if size == len(self._rewards):
+      self._grow()
+    self._rewards[size] = step.reward
+    self._phases[size] = step.phase_value
+    self._timestamps_micros[size] = step.timestamp_micros
+    self.observation_pbs.append(step.observation_pb)
+    self.action_pbs.append(step.action_pb)
+    self._size = size + 1
+    if (self._compress_threshold and
+        len(self.observation_pbs) >= self._compress_threshold):
+      self._compressed_chunks.append((_compress_protos(self.observation_pbs),
+                                      _compress_protos(self.action_pbs)))
+      self.observation_pbs = []
+      self.action_pbs = []
+
+  def decompress(self):
+    """Restore compressed protos so that the proto lists contain all steps."""
+    if not self._compressed_chunks:
+      return
+    observation_pbs = []
+    action_pbs = []
+    for compressed_observations, compressed_actions in self._compressed_chunks:
+      observation_pbs.extend(_decompress_protos(
+          compressed_observations, observation_pb2.ObservationData))
+      action_pbs.extend(_decompress_protos(
+          compressed_actions, action_pb2.ActionData))
+    observation_pbs.extend(self.observation_pbs)
+    action_pbs.extend(self.action_pbs)
+    self.observation_pbs = observation_pbs
+    self.action_pbs = action_pbs
+    self._compressed_chunks = []
+
+
 def generate_index_and_step_phase(number_of_steps, final_phase):
   """Generate an index and phase for a number of steps.
 
@@ -141,6 +452,59 @@ def generate_index_and_step_phase(number_of_steps, final_phase):
     yield (i, step_phase)
 
 
+def _select_row(nest, index):
+  """Select a row from each array in a nest of batched arrays.
+
+  Args:
+    nest: Nest of arrays where the outer dimension is the batch dimension.
+    index: Index of the row to select.
+
+  Returns:
+    Nest of arrays with the same structure as nest.
+  """
+  return tf.nest.map_structure(lambda array: array[index], nest)
+
+
+def _episode_columns_to_batched_trajectory(episode, brain_spec):
+  """Convert the columns of an episode into a batched Trajectory object.
+
+  This is equivalent to creating a Trajectory for each pair of consecutive
+  steps with trajectory.from_transition() and combining them with
+  batch_trajectories() but builds each batched leaf directly from the columns.
+
+  Args:
+    episode: _EpisodeColumns instance that contains at least 2 steps.
+    brain_spec: spec.BrainSpec instance used to convert observation and action
+      data protos to TF agents data structures.
+
+  Returns:
+    A TF agents Trajectory instance that references numpy arrays which contain
+    the len(episode) - 1 transitions in the episode.
+  """
+  episode.decompress()
+  observations = brain_spec.observation_spec.tfa_value_batch(
+      episode.observation_pbs)
+  actions = brain_spec.action_spec.tfa_value_batch(episode.action_pbs)
+  # Compute the step type, reward and discount of the time step created by
+  # _time_step() for each step.
+  phases = episode.phases
+  step_types = _PHASE_VALUE_TO_STEP_TYPE[phases]
+  rewards = np.where(phases == _START_PHASE_VALUE, _REWARD_ZERO,
+                     episode.rewards)
+  discounts = _PHASE_VALUE_TO_DISCOUNT[phases]
+  # Each transition is formed from the observation and action of a step and
+  # the step type, reward and discount of the following step.
+  all_but_last = lambda array: array[:-1]
+  return trajectory.Trajectory(
+      step_type=step_types[:-1],
+      observation=tf.nest.map_structure(all_but_last, observations),
+      action=tf.nest.map_structure(all_but_last, actions),
+      policy_info=(),
+      next_step_type=step_types[1:],
+      reward=rewards[1:],
+      discount=discounts[1:])
+
+
 def episode_steps_to_trajectories(episode_steps, brain_spec):
   """Convert human demonstration episode steps into Trajectory objects.
 
@@ -152,26 +516,32 @@ def episode_steps_to_trajectories(episode_steps, brain_spec):
   Returns:
     A list of Trajectory instances from all steps with human demonstrations.
   """
-  observation_spec = brain_spec.observation_spec
-  action_spec = brain_spec.action_spec
-  trajectories = []
-  previous_timestep = None
-  previous_episode_step = None
-  for current_episode_step in episode_steps:
-    if (current_episode_step.action_pb.source !=
-        action_pb2.ActionData.HUMAN_DEMONSTRATION):
-      # Ignore non-demo frames
-      continue
-    current_timestep = current_episode_step.get_time_step(observation_spec)
-    if previous_timestep:
-      trajectories.append(trajectory.from_transition(
-          previous_timestep,
-          previous_episode_step.get_action_step(action_spec),
-          current_timestep))
-      del previous_timestep
-    previous_episode_step = current_episode_step
-    previous_timestep = current_timestep
-  return trajectories
+  episode = _EpisodeColumns.from_steps(episode_steps)
+  if len(episode) < 2:
+    return []
+  batched_trajectory = _episode_columns_to_batched_trajectory(
+      episode, brain_spec)
+  return [_select_row(batched_trajectory, index)
+          for index in range(len(episode) - 1)]
+
+
+def episode_steps_to_batched_trajectory(episode_steps, brain_spec):
+  """Convert human demonstration episode steps into a batched Trajectory.
+
+  Args:
+    episode_steps: Iterable of Step instances.
+    brain_spec: spec.BrainSpec instance used to convert observation and action
+      data protos to TF agents data structures.
+
+  Returns:
+    A TF agents Trajectory instance that references numpy arrays which contain
+    all transitions between steps with human demonstrations or None if there
+    are fewer than 2 steps with human demonstrations.
+  """
+  episode = _EpisodeColumns.from_steps(episode_steps)
+  if len(episode) < 2:
+    return None
+  return _episode_columns_to_batched_trajectory(episode, brain_spec)
 
 
 def batch_trajectories(trajectories):
@@ -182,32 +552,48 @@ def batch_trajectories(trajectories):
       a single Trajectory instance.
 
   Returns:
-    A TF agents Trajectory instance that references tensors which contains all
-    steps in the provided trajectories list.
+    A TF agents Trajectory instance that references numpy arrays which contain
+    all steps in the provided trajectories list.
   """
 
-  def _stack_trajectories(*trajectory_tensors):
-    """Stack a list of tensors into a single tensor.
-
-    Args:
-      *trajectory_tensors: Tensor / numpy array instances in positional
-        arguments as required to use tf.nest.map_structure().
-
-    Returns:
-      tf.Tensor instance in the form [trajectories0 .. trajectoriesN] i.e
-      batched by N where N is the number of trajectories arguments passed to
-      this method.
-    """
-    return tf.stack(trajectory_tensors)
-
   # Each tf_agents TimeStep (from observation) and tf_agents PolicyStep
   # (from action), referenced by each Trajectory instance, is a nested
   # dictionary with numpy arrays or tensors as leaves
   # (see tfa_specs.SpecBase.tfa_value()). This nested structure is converted
   # from a list of Trajectory instances to a single Trajectory instance
-  # where each leaf is a tensor with a batch size of N where N is the
-  # number of trajectories in the episode.
-  return tf.nest.map_structure(_stack_trajectories, *trajectories)
+  # where each leaf is an array with a batch size of N where N is the
+  # number of trajectories in the episode. Leaves are stacked with numpy rather
+  # than tf.stack() to avoid dispatching an eager op for each leaf, consumers
+  # convert the arrays to tensors when required.
+  #
+  # All trajectories are generated from the same spec so each is flattened
+  # once and the stacked leaves are packed using the structure of the first
+  # trajectory, rather than validating the structure of every trajectory
+  # with tf.nest.map_structure().
+  flat_trajectories = [tf.nest.flatten(t) for t in trajectories]
+  return tf.nest.pack_sequence_as(
+      trajectories[0],
+      [np.stack(leaves) for leaves in zip(*flat_trajectories)])
+
+
+def _episode_columns_to_batched_trajectories(episodes, brain_spec):
+  """Convert the columns of episodes into batched Trajectory objects.
+
+  Args:
+    episodes: Iterable of _EpisodeColumns instances.
+    brain_spec: spec.BrainSpec instance used to convert observation and action
+      data protos to TF agents data structures.
+
+  Yields:
+    (batched_trajectory, size_of_batch) for each episode. Where
+    batched_trajectory is a TF agents Trajectory instance that references
+    numpy arrays which contain all steps in the episode. size_of_batch is the
+    number of steps in batched_trajectory.
+  """
+  for episode in episodes:
+    if len(episode) >= 2:
+      yield (_episode_columns_to_batched_trajectory(episode, brain_spec),
+             len(episode) - 1)
 
 
 def episodes_to_trajectories(episodes, brain_spec):
@@ -222,16 +608,15 @@ def episodes_to_trajectories(episodes, brain_spec):
     brain_spec: spec.BrainSpec instance used to convert observation and action
       data protos to TF agents data structures.
 
-  Yields:
-    (batched_trajectory, size_of_batch) for each episode. Where
-    batched_trajectory is a TF agents Trajectory instance that references
-    tensors which contains all steps in the episode. size_of_batch is the
-    number of steps in batched_trajectory.
+  Returns:
+    Generator that yields (batched_trajectory, size_of_batch) for each
+    episode. Where batched_trajectory is a TF agents Trajectory instance that
+    references numpy arrays which contain all steps in the episode.
+    size_of_batch is the number of steps in batched_trajectory.
   """
-  for episode in episodes:
-    trajectories = episode_steps_to_trajectories(episode, brain_spec)
-    if trajectories:
-      yield (batch_trajectories(trajectories), len(trajectories))
+  return _episode_columns_to_batched_trajectories(
+      (_EpisodeColumns.from_steps(episode) for episode in episodes),
+      brain_spec)
 
 
 class DemonstrationBuffer:
@@ -244,23 +629,35 @@ class DemonstrationBuffer:
     while ...:
       for ...:
         d.record_step(step)
-      for episode in d.flush_episode_demonstrations():
-        for frame in episode:
-          # frame is a trajectory that represents a demo frame.
-          replay_buffer.add_batch(frame)
+      for batched_trajectory, _ in d.flush_episode_demonstrations():
+        # batched_trajectory contains all demo frames of an episode.
+        replay_buffer.add_batch(batched_trajectory)
   """
 
-  def __init__(self, brain_spec):
+  def __init__(self, brain_spec, compress_threshold=None):
     """Initialize the demonstration buffer instance.
 
     Args:
       brain_spec: tfa_specs.BrainSpec instance used to convert Step instances to
         TF agents data structures.
+      compress_threshold: If set, the observation and action protos of an
+        in-progress episode are compressed in chunks of this many steps,
+        which reduces the memory used by long episodes at the cost of
+        serializing and parsing each proto.
     """
-    # Maps episodes to lists of frames.
-    self._episode_buffer = collections.defaultdict(list)
+    # Maps episodes to the columns of their human demonstration frames.
+    self._episode_buffer = {}
     self._completed_episodes = []
     self._brain_spec = brain_spec
+    self._compress_threshold = compress_threshold
+    # Columns of finished episodes that are reset and reused for new episodes
+    # rather than allocating new columns for each episode.
+    self._free_episodes = []
+    # Id and columns of the episode of the most recently recorded step.
+    # Steps usually arrive in runs from the same episode so this avoids
+    # looking up the episode in _episode_buffer for each step.
+    self._last_episode_id = _NO_EPISODE
+    self._last_episode = None
 
   def record_step(self, step):
     """Records a known state+action from a given env.
@@ -268,27 +665,65 @@ class DemonstrationBuffer:
     Args:
       step: A Step instance.
     """
-    steps = self._episode_buffer[step.episode_id]
-    steps.append(step)
-    if _is_episode_end(step.phase):
-      if step.phase != StepPhase.ABORTED:
-        self._completed_episodes.append(steps)
-      del self._episode_buffer[step.episode_id]
+    episode_id = step.episode_id
+    last_episode_id = self._last_episode_id
+    if episode_id is last_episode_id or episode_id == last_episode_id:
+      episode = self._last_episode
+    else:
+      episode = self._episode_buffer.get(episode_id)
+      if episode is None:
+        episode = (self._free_episodes.pop() if self._free_episodes else
+                   _EpisodeColumns(compress_threshold=self._compress_threshold))
+        self._episode_buffer[episode_id] = episode
+      self._last_episode_id = episode_id
+      self._last_episode = episode
+    episode.record_step(step)
+    phase_value = step.phase_value
+    if _is_episode_end(phase_value):
+      if phase_value != _ABORTED_PHASE_VALUE:
+        self._completed_episodes.append(episode)
+      else:
+        self._recycle_episode(episode)
+      del self._episode_buffer[episode_id]
+      self._last_episode_id = _NO_EPISODE
+      self._last_episode = None
 
   def flush_episode_demonstrations(self):
     """Removes completed episodes and yields batched trajectories and length.
 
     Returns:
-      Generator that yields (batched_trajectory, size_of_batch) for each
-      episode. Where batched_trajectory is a TF agents Trajectory instance that
-      references tensors which contains all steps in the episode.
-      size_of_batch is the number of steps in batched_trajectory.
+      List of (batched_trajectory, size_of_batch) for each episode. Where
+      batched_trajectory is a TF agents Trajectory instance that references
+      numpy arrays which contain all steps in the episode. size_of_batch is
+      the number of steps in batched_trajectory.
     """
     episodes = self._completed_episodes
     self._completed_episodes = []
-    return episodes_to_trajectories(episodes, self._brain_spec)
+    batched_trajectories = []
+    for index, episode in enumerate(episodes):
+      # Release the reference to each episode's protos once it's converted.
+      episodes[index] = None
+      if len(episode) >= 2:
+        batched_trajectories.append(
+            (_episode_columns_to_batched_trajectory(episode, self._brain_spec),
+             len(episode) - 1))
+      self._recycle_episode(episode)
+    return batched_trajectories
+
+  def _recycle_episode(self, episode):
+    """Reset the columns of a finished episode so they can be reused.
+
+    Args:
+      episode: _EpisodeColumns instance that is no longer referenced by the
+        buffer.
+    """
+    if len(self._free_episodes) < _MAX_FREE_EPISODES:
+      episode.reset()
+      self._free_episodes.append(episode)
 
   def clear(self):
     """Clear the demonstration buffer."""
     self._episode_buffer.clear()
     self._completed_episodes.clear()
+    self._last_episode_id = _NO_EPISODE
+    self._last_episode = None
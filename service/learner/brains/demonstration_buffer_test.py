@@ -16,7 +16,6 @@
 
 # pylint: disable=g-bad-import-order
 from absl.testing import absltest
-from unittest import mock
 
 import numpy as np
 import tensorflow as tf
@@ -100,7 +99,110 @@ class DemonstrationBufferTest(absltest.TestCase):
         demonstration_buffer.StepPhase.SUCCESS):
       demo_buffer.record_step(step)
     demo_buffer.clear()
-    self.assertEmpty(list(demo_buffer.flush_episode_demonstrations()))
+    self.assertEmpty(demo_buffer.flush_episode_demonstrations())
+
+  def test_record_consecutive_episodes(self):
+    """Test recording steps of consecutive episodes with different IDs."""
+    demo_buffer = demonstration_buffer.DemonstrationBuffer(
+        tfa_specs.BrainSpec(test_data.brain_spec()))
+    # None is a valid episode ID. The IDs of the last episode compare equal but
+    # are built separately for each step so they are not the same object.
+    for episode_ids in ([None] * self._EPISODE_LENGTH,
+                        ['episode_a'] * self._EPISODE_LENGTH,
+                        ['episode_' + str(1)
+                         for _ in range(self._EPISODE_LENGTH)]):
+      for episode_id, step in zip(episode_ids, self._generate_episode_steps(
+          0, self._EPISODE_LENGTH, demonstration_buffer.StepPhase.SUCCESS)):
+        step.episode_id = episode_id
+        demo_buffer.record_step(step)
+
+    self.assertEqual(
+        [frames for _, frames in demo_buffer.flush_episode_demonstrations()],
+        [self._EPISODE_LENGTH - 1] * 3)
+
+  def test_episode_columns_compress(self):
+    """Test compressing the protos of episode steps."""
+    steps = list(self._generate_episode_steps(
+        0, 5, demonstration_buffer.StepPhase.SUCCESS))
+    # pylint: disable=protected-access
+    columns = demonstration_buffer._EpisodeColumns(compress_threshold=2)
+    for step in steps:
+      columns.record_step(step)
+    self.assertLen(columns.observation_pbs, 1)
+
+    columns.decompress()
+    self.assertLen(columns, len(steps))
+    self.assertEqual(columns.observation_pbs,
+                     [s.observation_pb for s in steps])
+    self.assertEqual(columns.action_pbs, [s.action_pb for s in steps])
+
+  def test_compressed_episodes(self):
+    """Test converting episodes with compressed protos."""
+    brain_spec = tfa_specs.BrainSpec(test_data.brain_spec())
+    steps = list(self._generate_episode_steps(
+        0, self._EPISODE_LENGTH, demonstration_buffer.StepPhase.SUCCESS))
+    demo_buffer = demonstration_buffer.DemonstrationBuffer(
+        brain_spec, compress_threshold=3)
+    for step in steps:
+      demo_buffer.record_step(step)
+
+    [(batched_trajectory, frames)] = (
+        demo_buffer.flush_episode_demonstrations())
+    expected_trajectory = (
+        demonstration_buffer.episode_steps_to_batched_trajectory(
+            steps, brain_spec))
+    self.assertEqual(frames, self._EPISODE_LENGTH - 1)
+    tf.nest.map_structure(np.testing.assert_array_equal,
+                          batched_trajectory, expected_trajectory)
+
+  def test_get_time_step(self):
+    """Test converting steps in each phase to time steps."""
+    observation_spec = tfa_specs.BrainSpec(
+        test_data.brain_spec()).observation_spec
+    phase_to_expected = {
+        demonstration_buffer.StepPhase.START: (ts.StepType.FIRST, 0.0, 1.0),
+        demonstration_buffer.StepPhase.IN_PROGRESS: (ts.StepType.MID, 0.5,
+                                                     1.0),
+        demonstration_buffer.StepPhase.SUCCESS: (ts.StepType.LAST, 0.5, 0.0),
+        demonstration_buffer.StepPhase.FAILURE: (ts.StepType.LAST, 0.5, 0.0),
+        demonstration_buffer.StepPhase.GAVE_UP: (ts.StepType.LAST, 0.5, 0.0),
+        demonstration_buffer.StepPhase.ABORTED: (ts.StepType.LAST, 0.5, 1.0),
+    }
+    for phase, (step_type, reward, discount) in phase_to_expected.items():
+      time_step = demonstration_buffer.Step(
+          episode_id='episode',
+          phase=phase,
+          observation_pb=test_data.observation_data(1, (1, 1, 1)),
+          action_pb=test_data.action_data(0, 0.5),
+          reward=0.5,
+          timestamp_micros=0).get_time_step(observation_spec)
+      self.assertEqual(time_step.step_type, step_type, msg=phase)
+      self.assertEqual(time_step.reward, reward, msg=phase)
+      self.assertEqual(time_step.discount, discount, msg=phase)
+
+  def test_episode_columns(self):
+    """Test storing episode steps in columns that grow when full."""
+    steps = list(self._generate_episode_steps(
+        0, 5, demonstration_buffer.StepPhase.SUCCESS))
+    # Ignore step 1
+    steps[1].action_pb.source = action_pb2.ActionData.ActionSource.BRAIN_ACTION
+    # pylint: disable=protected-access
+    columns = demonstration_buffer._EpisodeColumns(capacity=1)
+    for step in steps:
+      columns.record_step(step)
+
+    expected_steps = [steps[0], steps[2], steps[3], steps[4]]
+    self.assertLen(columns, len(expected_steps))
+    self.assertEqual(columns.rewards.tolist(),
+                     [s.reward for s in expected_steps])
+    self.assertEqual(columns.phases.tolist(),
+                     [s.phase.value for s in expected_steps])
+    self.assertEqual(columns.timestamps_micros.tolist(),
+                     [s.timestamp_micros for s in expected_steps])
+    self.assertEqual(columns.observation_pbs,
+                     [s.observation_pb for s in expected_steps])
+    self.assertEqual(columns.action_pbs,
+                     [s.action_pb for s in expected_steps])
 
   def test_episode_steps_to_trajectories(self):
     """Test converting episode steps to trajectories."""
@@ -207,8 +309,41 @@ class DemonstrationBufferTest(absltest.TestCase):
                                   expected_trajectory,
                                   expand_composites=True)
 
-  @mock.patch.object(demonstration_buffer, 'batch_trajectories')
-  def testEpisodesToTrajectories(self, mock_batch_trajectories):
+  def test_episode_steps_to_batched_trajectory(self):
+    """Test converting episode steps to a batched trajectory."""
+    brain_spec = tfa_specs.BrainSpec(test_data.brain_spec())
+    steps = list(self._generate_episode_steps(
+        0, 5, demonstration_buffer.StepPhase.SUCCESS))
+    # Ignore step 2
+    steps[2].action_pb.source = action_pb2.ActionData.ActionSource.BRAIN_ACTION
+    demo_steps = [steps[0], steps[1], steps[3], steps[4]]
+    time_steps = [s.get_time_step(brain_spec.observation_spec)
+                  for s in demo_steps]
+    expected_trajectory = demonstration_buffer.batch_trajectories([
+        trajectory.from_transition(
+            time_step, step.get_action_step(brain_spec.action_spec),
+            next_time_step)
+        for time_step, step, next_time_step in zip(
+            time_steps, demo_steps, time_steps[1:])])
+
+    batched_trajectory = (
+        demonstration_buffer.episode_steps_to_batched_trajectory(
+            steps, brain_spec))
+
+    tf.nest.assert_same_structure(batched_trajectory, expected_trajectory)
+    tf.nest.map_structure(np.testing.assert_array_equal,
+                          batched_trajectory, expected_trajectory)
+
+  def test_episode_steps_to_batched_trajectory_too_short(self):
+    """Test converting an episode with a single demo step."""
+    steps = list(self._generate_episode_steps(
+        0, 2, demonstration_buffer.StepPhase.SUCCESS))
+    steps[0].action_pb.source = action_pb2.ActionData.ActionSource.BRAIN_ACTION
+    self.assertIsNone(
+        demonstration_buffer.episode_steps_to_batched_trajectory(
+            steps, tfa_specs.BrainSpec(test_data.brain_spec())))
+
+  def testEpisodesToTrajectories(self):
     """Test converting episodes to batched trajectories."""
     episode_step_generators = []
     number_of_steps = 5
@@ -217,12 +352,13 @@ class DemonstrationBufferTest(absltest.TestCase):
           self._generate_episode_steps(
               i, number_of_steps, demonstration_buffer.StepPhase.SUCCESS))
 
-    mock_trajectories = [42, 21]
-    mock_batch_trajectories.side_effect = lambda _: mock_trajectories.pop(0)
     trajectories_and_sizes = list(demonstration_buffer.episodes_to_trajectories(
         episode_step_generators, tfa_specs.BrainSpec(test_data.brain_spec())))
-    self.assertEqual(trajectories_and_sizes,
-                     [(42, number_of_steps - 1), (21, number_of_steps - 1)])
+    self.assertEqual([size for _, size in trajectories_and_sizes],
+                     [number_of_steps - 1, number_of_steps - 1])
+    for batched_trajectory, size in trajectories_and_sizes:
+      self.assertEqual(batched_trajectory.step_type.shape, (size,))
+      self.assertEqual(batched_trajectory.reward.shape, (size,))
 
 
 if __name__ == '__main__':
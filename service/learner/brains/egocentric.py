@@ -20,11 +20,18 @@ file contains the necessary transformation function to translate world-centric
 observations inputs into ego-centric observation signals, and to translate
 egocentric observation outputs into camera-centric control signals for
 camera-relative controls.
+
+All functions accept tensors with any number of leading batch dimensions, so
+signals for many entities and / or time steps should be computed by stacking
+the inputs and making a single call rather than calling a function for each
+entity or step.
 """
 
 import collections
+import functools
 
 from learner.brains import quaternion
+import numpy as np
 import tensorflow as tf
 
 
@@ -97,12 +104,27 @@ def angle_magnitude_to_vec(radians, magnitude):
   Returns:
     A float tensor of size B1 x ... x Bn x 2 representing a 2D vector.
   """
-  radians = tf.expand_dims(radians, axis=-1)
-  magnitude = tf.expand_dims(magnitude, axis=-1)
   # We use unity conventions, so we need to negate radians to get the
-  # clockwise angle.
-  return tf.concat(
-      [tf.sin(-radians) * magnitude, tf.cos(-radians) * magnitude], axis=-1)
+  # clockwise angle. sin(-radians) = -sin(radians) and
+  # cos(-radians) = cos(radians) so the negation is folded into the result.
+  return tf.stack(
+      [-tf.sin(radians) * magnitude, tf.cos(radians) * magnitude], axis=-1)
+
+
+@functools.lru_cache(maxsize=None)
+def _identity_quaternion(dtype):
+  """Get the identity quaternion for a dtype.
+
+  A numpy array is cached rather than a tensor so that it can be used in both
+  eager and graph contexts.
+
+  Args:
+    dtype: Tensorflow or numpy data type.
+  Returns:
+    A numpy array [0, 0, 0, 1] of the requested dtype.
+  """
+  return np.array([0.0, 0.0, 0.0, 1.0],
+                  dtype=tf.as_dtype(dtype).as_numpy_dtype)
 
 
 def normalize_and_fix_quaternion(quat):
@@ -113,12 +135,12 @@ def normalize_and_fix_quaternion(quat):
   Returns:
     A tensor of normalized quaternions of the same shape as the input.
   """
-  identity_quat = tf.constant([0.0, 0.0, 0.0, 1.0], dtype=quat.dtype)
-  is_zero = tf.expand_dims(
-      tf.cast(tf.norm(quat, axis=-1) == 0.0, dtype=quat.dtype),
-      axis=-1)
-  fixed_quats = is_zero * identity_quat + (1 - is_zero) * quat
-  return quaternion.normalize(fixed_quats)
+  identity_quat = _identity_quaternion(quat.dtype)
+  # Compute the norm once and use it both to normalize and to find zero
+  # quaternions rather than measuring the normalized quaternions again.
+  magnitude = tf.norm(quat, axis=-1, keepdims=True)
+  return tf.where(tf.equal(magnitude, 0), identity_quat,
+                  tf.math.divide_no_nan(quat, magnitude))
 
 
 def normalize_vector_no_nan(vec):
@@ -141,8 +163,8 @@ def sign_no_zero(tensor):
   Returns:
     A tensor of the same shape as the input, containing only ones and zeros.
   """
-  s = tf.sign(tensor)
-  return tf.where(tf.equal(s, 0.0), tf.ones_like(s), s)
+  ones = tf.ones_like(tensor)
+  return tf.where(tensor >= 0, ones, -ones)
 
 
 def up(orientation):
@@ -155,9 +177,7 @@ def up(orientation):
     A tensor of shape (A1,...,An, 3) representing the requested direction in the
     input frames of reference.
   """
-  return quaternion.rotate(
-      tf.constant([0.0, 1.0, 0.0], orientation.dtype),
-      orientation)
+  return quaternion.to_rotation_matrix(orientation)[..., :, 1]
 
 
 def down(orientation):
@@ -170,9 +190,7 @@ def down(orientation):
     A tensor of shape (A1,...,An, 3) representing the requested direction in the
     input frames of reference.
   """
-  return quaternion.rotate(
-      tf.constant([0.0, -1.0, 0.0], orientation.dtype),
-      orientation)
+  return -quaternion.to_rotation_matrix(orientation)[..., :, 1]
 
 
 def right(orientation):
@@ -185,9 +203,7 @@ def right(orientation):
     A tensor of shape (A1,...,An, 3) representing the requested direction in the
     input frames of reference.
   """
-  return quaternion.rotate(
-      tf.constant([1.0, 0.0, 0.0], orientation.dtype),
-      orientation)
+  return quaternion.to_rotation_matrix(orientation)[..., :, 0]
 
 
 def left(orientation):
@@ -200,9 +216,7 @@ def left(orientation):
     A tensor of shape (A1,...,An, 3) representing the requested direction in the
     input frames of reference.
   """
-  return quaternion.rotate(
-      tf.constant([-1.0, 0.0, 0.0], orientation.dtype),
-      orientation)
+  return -quaternion.to_rotation_matrix(orientation)[..., :, 0]
 
 
 def forward(orientation):
@@ -215,9 +229,7 @@ def forward(orientation):
     A tensor of shape (A1,...,An, 3) representing the requested direction in the
     input frames of reference.
   """
-  return quaternion.rotate(
-      tf.constant([0.0, 0.0, 1.0], orientation.dtype),
-      orientation)
+  return quaternion.to_rotation_matrix(orientation)[..., :, 2]
 
 
 def back(orientation):
@@ -230,9 +242,7 @@ def back(orientation):
     A tensor of shape (A1,...,An, 3) representing the requested direction in the
     input frames of reference.
   """
-  return quaternion.rotate(
-      tf.constant([0.0, 0.0, -1.0], orientation.dtype),
-      orientation)
+  return -quaternion.to_rotation_matrix(orientation)[..., :, 2]
 
 
 EgocentricSignal = collections.namedtuple(
@@ -271,27 +281,21 @@ def egocentric_signal(orientation,
   direction_to_goal = goal_position - position
   distances = tf.norm(direction_to_goal, axis=-1)
 
-  def _project_onto(target_vector, *vs):
-    """Project target_vector onto remaining vectors."""
-    return [vector_dot(v, target_vector, scalar_out=False) for v in vs]
-
   def _to_local_frame(orientation, direction):
     """Project a target vector into a local reference frame."""
-    return _project_onto(
-        direction,
-        right(orientation),
-        up(orientation),
-        forward(orientation))
-
-  x_local, y_local, z_local = _to_local_frame(orientation, direction_to_goal)
+    # Columns of the rotation matrix are the right, up and forward directions
+    # so multiplying by its transpose projects onto all three at once.
+    return tf.linalg.matvec(quaternion.to_rotation_matrix(orientation),
+                            direction, transpose_a=True)
 
-  def _construct_2d_direction(x, y):
-    """Construct 2D unit vectors from batched x and y components."""
-    return normalize_vector_no_nan(
-        tf.concat([x, y], axis=-1))
+  local_direction = _to_local_frame(orientation, direction_to_goal)
 
-  xz_rel_dir = _construct_2d_direction(x_local, z_local)
-  yz_rel_dir = _construct_2d_direction(y_local, z_local)
+  # Gather the (x, z) and (y, z) components of the local direction into a
+  # [A1, ..., An, 2, 2] tensor so both 2D directions are normalized at once.
+  rel_dirs = normalize_vector_no_nan(
+      tf.gather(local_direction, [[0, 2], [1, 2]], axis=-1))
+  xz_rel_dir = rel_dirs[..., 0, :]
+  yz_rel_dir = rel_dirs[..., 1, :]
 
   return EgocentricSignal(xz_rel_dir, yz_rel_dir, distances)
 
@@ -299,7 +303,8 @@ def egocentric_signal(orientation,
 def egocentric_signal_to_target_frame(
     orientation,
     camera_orientation,
-    egocentric_direction):
+    egocentric_direction,
+    assume_normalized=False):
   """Translates an ego-centric signal to a camera-relative control frame.
 
   This takes a 2D directional control signal indicating a direction on the XZ
@@ -335,53 +340,75 @@ def egocentric_signal_to_target_frame(
     camera_orientation: A (possibly batched) tensor of shape [A1, ..., An, 4]
       representing the orientation of cameras that serve as frames of reference
       for controlling the entities.
-      Orientations are relative to world-space.
+      Orientations are relative to world-space. If this is None, world-space
+      is used as the frame of reference which is cheaper to compute than
+      passing identity quaternions.
     egocentric_direction: A (possibly batched) tensor of shape [A1, ..., An, 2]
       representing 2D control vectors that indicate a desired direction in the
       XZ plane of the controlled entities, relative to orientation.
+    assume_normalized: Whether orientation and camera_orientation are known to
+      be unit quaternions. If this is True, the quaternions are not normalized
+      and zero quaternions are not replaced with the identity.
 
   Returns:
     A (possibly batched) tensor of shape [A1, ..., An, 2] indicating a direction
     signal relative to the camera.
   """
-  orientation = normalize_and_fix_quaternion(orientation)
-  camera_orientation = normalize_and_fix_quaternion(camera_orientation)
+  world_space_camera = camera_orientation is None
+  if not assume_normalized:
+    orientation = normalize_and_fix_quaternion(orientation)
 
-  # Compute intersection of camera YZ plane and entity XZ plane.
-  control_fwd = normalize_vector_no_nan(
-      vector_cross(up(orientation),
-                   left(camera_orientation)))
+  # Build each rotation matrix once and read the directions from its columns
+  # rather than rotating each axis separately.
+  entity_basis = quaternion.to_rotation_matrix(orientation)
+  entity_up = entity_basis[..., :, 1]
 
-  control_right = vector_cross(control_fwd, up(orientation))
+  # Compute intersection of camera YZ plane and entity XZ plane.
+  if world_space_camera:
+    # The camera right direction is [1, 0, 0] so the cross product of up with
+    # the camera left direction is [0, -up.z, up.y].
+    control_fwd = normalize_vector_no_nan(tf.stack(
+        [tf.zeros_like(entity_up[..., 0]), -entity_up[..., 2],
+         entity_up[..., 1]], axis=-1))
+  else:
+    if not assume_normalized:
+      camera_orientation = normalize_and_fix_quaternion(camera_orientation)
+    # [A1, ..., An, 3, 2] tensor whose columns are the camera right and
+    # forward directions.
+    camera_right_fwd = tf.gather(
+        quaternion.to_rotation_matrix(camera_orientation), [0, 2], axis=-1)
+    control_fwd = normalize_vector_no_nan(
+        vector_cross(entity_up, -camera_right_fwd[..., 0]))
+
+  control_right = vector_cross(control_fwd, entity_up)
+
+  # [A1, ..., An, 2, 3] tensor whose rows are the control right and forward
+  # directions.
+  control_right_fwd = tf.stack([control_right, control_fwd], axis=-2)
 
   # If the camera is upside down, it's possible that the vectors point the
-  # wrong way, so we check for that and possibly fix it.
-  is_fwd = sign_no_zero(
-      vector_dot(control_fwd, forward(camera_orientation), scalar_out=False))
-  is_right = sign_no_zero(
-      vector_dot(control_right, right(camera_orientation), scalar_out=False))
-
-  control_fwd *= is_fwd
-  control_right *= is_right
-
-  # Turn the 2D control signal into a 3D signal.
-  egocentric_direction_3d = tf.concat(
-      [egocentric_direction[..., 0:1],                 # [X] component
-       tf.zeros_like(egocentric_direction[..., 0:1]),  # [0]
-       egocentric_direction[..., 1:2]], axis=-1)       # [Z] component
-
-  # Compute the intended control direction in world-space.
-  world_space_direction = quaternion.rotate(egocentric_direction_3d,
-                                            orientation)
+  # wrong way, so we check for that and possibly fix it. This computes the dot
+  # product of each control direction with its camera direction.
+  if world_space_camera:
+    # Dot products with [1, 0, 0] and [0, 0, 1] select the X component of the
+    # right direction and the Z component of the forward direction.
+    camera_dots = tf.stack([control_right[..., 0], control_fwd[..., 2]],
+                           axis=-1)
+  else:
+    camera_dots = tf.einsum('...ij,...ji->...i', control_right_fwd,
+                            camera_right_fwd)
+  is_right_fwd = sign_no_zero(camera_dots)
+
+  # Compute the intended control direction in world-space. The 2D control
+  # signal is the [X] and [Z] components of a 3D signal with a zero [Y]
+  # component, so rotating it only requires the right and forward columns of
+  # the entity rotation matrix.
+  world_space_direction = tf.linalg.matvec(
+      tf.gather(entity_basis, [0, 2], axis=-1), egocentric_direction)
 
   # Project the desired world-space directions into a camera-relative control
-  # frame.
-  camera_control_vector_x = vector_dot(control_right, world_space_direction,
-                                       scalar_out=False)
-  camera_control_vector_y = vector_dot(control_fwd, world_space_direction,
-                                       scalar_out=False)
-
-  camera_control_vector = tf.concat([camera_control_vector_x,
-                                     camera_control_vector_y], axis=-1)
+  # frame, flipping the control directions that point the wrong way.
+  camera_control_vector = is_right_fwd * tf.linalg.matvec(
+      control_right_fwd, world_space_direction)
 
   return camera_control_vector
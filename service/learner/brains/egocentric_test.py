@@ -14,6 +14,8 @@
 
 """Tests for google3.research.kernel.falken.service.learner.brains.egocentric."""
 
+import functools
+
 from absl.testing import absltest
 from absl.testing import parameterized
 
@@ -30,9 +32,12 @@ def tensor_to_list(t):
   return t.numpy().tolist()
 
 
+@functools.lru_cache(maxsize=None)
 def quat_from_string(quat_str):
   """Translate a string with rotation instructions to a quaternion.
 
+  Results are cached as the same rotations are used by many test cases.
+
   Args:
     quat_str: A rotation description executed left to right using 'y', 'p', 'r'
       to denote yaw pitch and roll.
@@ -260,6 +265,37 @@ class EgocentricTest(parameterized.TestCase):
         egocentric.egocentric_signal_to_target_frame(
             identity, upside_down, control_signal), want)
 
+  def test_camera_frame_transform_world_space(self):
+    """Test that a missing camera orientation uses world-space."""
+    orientation = tf.stack([
+        quat_from_string(quat_str) for quat_str in (
+            '', 'y90', 'r180', 'p100', 'y90/r180', 'r-90', 'r90/y45/r-90')])
+    control_signal = tf.constant(
+        [[0, 1], [-1, 0], [1, 0], [0, -1], [0.5, 0.5], [-1, 1], [0.3, -0.2]],
+        dtype=tf.float32)
+    identity = tf.constant([[0, 0, 0, 1]] * len(control_signal),
+                           dtype=tf.float32)
+    self.assertFloatTensorEqual(
+        egocentric.egocentric_signal_to_target_frame(
+            orientation, None, control_signal),
+        egocentric.egocentric_signal_to_target_frame(
+            orientation, identity, control_signal))
+
+  def test_camera_frame_transform_assume_normalized(self):
+    """Test skipping normalization of unit quaternions."""
+    orientation = quat_from_string('y90/r180')
+    camera_orientation = quat_from_string('y-90/p45')
+    direction = tf.constant([1, 0], dtype=tf.float32)
+    want = tf.constant([1, 0], dtype=tf.float32)
+    # Quaternions are normalized by default.
+    self.assertFloatTensorEqual(
+        egocentric.egocentric_signal_to_target_frame(
+            orientation * 3, camera_orientation * 0.5, direction), want)
+    self.assertFloatTensorEqual(
+        egocentric.egocentric_signal_to_target_frame(
+            orientation, camera_orientation, direction,
+            assume_normalized=True), want)
+
   @parameterized.parameters(
       ((4,), (2,), (2,)),
       ((10, 4,), (10, 2,), (10, 2,)),
@@ -16,6 +16,8 @@
 
 from learner.brains import tensor_nest
 
+import tensorflow as tf
+
 
 class EvalDatastore:
   """Stores versioned sets of eval data in chunks.
@@ -43,10 +45,18 @@ class EvalDatastore:
     self._versions = []
     self._eval_frames = 0
 
-    self._buffer = []
+    # Trajectories added since the last version are buffered as a list of
+    # tensors for each leaf of the trajectory nest so that each leaf can be
+    # concatenated without traversing the nest of every trajectory.
+    self._buffer_structure = None
+    self._buffer_leaves = []
     self._buffer_eval_frames = 0
     self._chunks = []
     self._chunk_ids = {}
+    # Index of the last chunk in the most recently retrieved version and the
+    # concatenated data of the version, see get_version().
+    self._cached_chunk_index = None
+    self._cached_version_data = None
 
   def _version_id(self, chunk_index):
     """Get the version of the specified chunk.
@@ -87,11 +97,19 @@ class EvalDatastore:
       trajectory: TF Agents Trajectory instance to add to the datastore.
     """
     self._buffer_eval_frames += tensor_nest.batch_size(trajectory)
-    self._buffer.append(trajectory)
+    leaves = tf.nest.flatten(trajectory)
+    if self._buffer_structure is None:
+      self._buffer_structure = trajectory
+      self._buffer_leaves = [[leaf] for leaf in leaves]
+    else:
+      tf.nest.assert_same_structure(self._buffer_structure, trajectory)
+      for leaf_buffer, leaf in zip(self._buffer_leaves, leaves):
+        leaf_buffer.append(leaf)
 
   def _clear_buffer(self):
     """Clear the buffer used to aggregate trajectories for the next version."""
-    self._buffer.clear()
+    self._buffer_structure = None
+    self._buffer_leaves = []
     self._buffer_eval_frames = 0
 
   def clear(self):
@@ -102,6 +120,8 @@ class EvalDatastore:
     self._clear_buffer()
     self._chunks.clear()
     self._chunk_ids.clear()
+    self._cached_chunk_index = None
+    self._cached_version_data = None
 
   def create_version(self):
     """Create a new eval set version from buffer contents and return its id.
@@ -110,9 +130,11 @@ class EvalDatastore:
       A new version ID if data was added. The previous version ID if no data
       was added since the last version. None if the datastore is empty.
     """
-    if not self._buffer:
+    if self._buffer_structure is None:
       return self._versions[-1] if self._versions else None
-    chunk = tensor_nest.concatenate_batched(self._buffer)
+    chunk = tf.nest.pack_sequence_as(
+        self._buffer_structure,
+        [tf.concat(leaf_buffer, axis=0) for leaf_buffer in self._buffer_leaves])
     self._eval_frames += self._buffer_eval_frames
     self._clear_buffer()
 
@@ -141,5 +163,18 @@ class EvalDatastore:
       data for the requested version.
     """
     chunk_index = self._chunk_index(version)
-    chunks = self._chunks[:chunk_index + 1]
-    return tensor_nest.concatenate_batched(chunks)
+    cached_chunk_index = self._cached_chunk_index
+    if cached_chunk_index == chunk_index:
+      return self._cached_version_data
+
+    # Versions are usually retrieved in increasing order so extend the most
+    # recently retrieved version with the chunks added after it rather than
+    # concatenating all chunks again.
+    if cached_chunk_index is not None and cached_chunk_index < chunk_index:
+      chunks = ([self._cached_version_data] +
+                self._chunks[cached_chunk_index + 1:chunk_index + 1])
+    else:
+      chunks = self._chunks[:chunk_index + 1]
+    self._cached_version_data = tensor_nest.concatenate_batched(chunks)
+    self._cached_chunk_index = chunk_index
+    return self._cached_version_data
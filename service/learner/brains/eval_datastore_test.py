@@ -67,6 +67,33 @@ class EvalDatastoreTest(absltest.TestCase):
     self.assertEqual(list(ddata[0][1]['player']['health']), [1.0, 2.0])
     self.assertEqual(list(ddata[1][1]['player']['health']), [3])
 
+  def test_get_version_cached(self):
+    """Test retrieving versions in and out of order."""
+    ds = eval_datastore.EvalDatastore()
+    versions = []
+    for i in range(3):
+      ds.add_trajectory(test_data.trajectory(health=i,
+                                             add_batch_dimension=True))
+      versions.append(ds.create_version())
+
+    v3_data = ds.get_version(versions[2])
+    self.assertIs(ds.get_version(versions[2]), v3_data)
+    self.assertEqual(list(v3_data[1]['player']['health']), [0.0, 1.0, 2.0])
+    self.assertEqual(list(ds.get_version(versions[0])[1]['player']['health']),
+                     [0.0])
+    self.assertEqual(list(ds.get_version(versions[1])[1]['player']['health']),
+                     [0.0, 1.0])
+
+    ds.add_trajectory(test_data.trajectory(health=3, add_batch_dimension=True))
+    v4 = ds.create_version()
+    self.assertEqual(list(ds.get_version(v4)[1]['player']['health']),
+                     [0.0, 1.0, 2.0, 3.0])
+
+    ds.clear()
+    ds.add_trajectory(test_data.trajectory(health=4, add_batch_dimension=True))
+    v1 = ds.create_version()
+    self.assertEqual(list(ds.get_version(v1)[1]['player']['health']), [4.0])
+
   def test_empty_and_prev_version(self):
     """Verify create_version does not create a new eval set when empty."""
     ds = eval_datastore.EvalDatastore()
@@ -59,6 +59,63 @@ class OneHot(tf.keras.layers.Layer,
     return OneHot(config['depth'])
 
 
+def _pad_zero(inputs, padding):
+  """Pad the second dimension of a tensor with zeros.
+
+  Args:
+    inputs: A tensor with shape (batch, size, channels).
+    padding: (pad_left, pad_right) pair.
+
+  Returns:
+    Padded tensor.
+  """
+  # tf.pad interprets this as paddings per dimension. We only need to pad
+  # the middle dimension which is why the other two values are pairs of 0s.
+  return tf.pad(inputs, ((0, 0), padding, (0, 0)))
+
+
+def _pad_wrap(inputs, padding):
+  """Pad the second dimension of a tensor by wrapping around the tensor.
+
+  Args:
+    inputs: A tensor with shape (batch, size, channels).
+    padding: (pad_left, pad_right) pair.
+
+  Returns:
+    Padded tensor.
+  """
+  return tf.concat([
+      inputs[:, (-padding[0]):, :],
+      inputs,
+      inputs[:, :padding[1], :]
+  ], axis=1)
+
+
+def _pad_repeat(inputs, padding):
+  """Pad the second dimension of a tensor by repeating the edge values.
+
+  Args:
+    inputs: A tensor with shape (batch, size, channels).
+    padding: (pad_left, pad_right) pair.
+
+  Returns:
+    Padded tensor.
+  """
+  return tf.concat([
+      tf.repeat(inputs[:, :1, :], padding[0], axis=1),
+      inputs,
+      tf.repeat(inputs[:, -1:, :], padding[1], axis=1)
+  ], axis=1)
+
+
+# Maps Pad1D padding modes to functions that pad a tensor.
+_PADDING_MODE_TO_PAD_FUNCTION = {
+    'zero': _pad_zero,
+    'wrap': _pad_wrap,
+    'repeat': _pad_repeat,
+}
+
+
 class Pad1D(tf.keras.layers.Layer,
             weights_initializer.NoWeightsInterface):
   """Pads a (batch, size, channels) tensor."""
@@ -76,8 +133,15 @@ class Pad1D(tf.keras.layers.Layer,
         - wrap: For padding wrapping around the tensor.
         - repeat: For padding with repeated values from the tensor edges.
       **kwargs: Other kwargs that should be sent to the layer superclass.
+
+    Raises:
+      ValueError: If the padding mode is not supported.
     """
-    self._padding = padding
+    # Select the padding function once rather than on each call.
+    self._pad = _PADDING_MODE_TO_PAD_FUNCTION.get(padding_mode)
+    if not self._pad:
+      raise ValueError(f'Padding mode {padding_mode} not supported.')
+    self._padding = tuple(padding)
     self._padding_mode = padding_mode
     super(Pad1D, self).__init__(**kwargs)
 
@@ -90,26 +154,7 @@ class Pad1D(tf.keras.layers.Layer,
     Returns:
       Output tensor after applying the layer.
     """
-    if self._padding_mode == 'zero':
-      # tf.pad interprets this as paddings per dimension. We only need to pad
-      # the middle dimension which is why the other two values are pairs of 0s.
-      paddings = ((0, 0), self._padding, (0, 0))
-      outputs = tf.pad(inputs, paddings)
-    elif self._padding_mode == 'wrap':
-      outputs = tf.concat([
-          inputs[:, (-self._padding[0]):, :],
-          inputs,
-          inputs[:, :self._padding[1], :]
-      ], axis=1)
-    elif self._padding_mode == 'repeat':
-      outputs = tf.concat([
-          tf.repeat(inputs[:, :1, :], self._padding[0], axis=1),
-          inputs,
-          tf.repeat(inputs[:, -1:, :], self._padding[1], axis=1)
-      ], axis=1)
-    else:
-      raise ValueError(f'Padding mode {self._padding_mode} not supported.')
-    return outputs
+    return self._pad(inputs, self._padding)
 
 
 class Feelers(tf.keras.layers.Layer,
@@ -326,7 +371,9 @@ class FlattenAndConcatenate(tf.keras.layers.Layer,
                             weights_initializer.NoWeightsInterface):
   """A layer that flattens tensors and concatenates them.
 
-  This layer removes outputs that are None.
+  This layer removes outputs that are None. Inputs are cast to the compute
+  dtype of the layer which follows the global Keras mixed precision policy
+  (float32 by default).
   """
 
   def call(self, inputs):
@@ -343,20 +390,19 @@ class FlattenAndConcatenate(tf.keras.layers.Layer,
       Error: If there are no input signals that are not None.
     """
     num_batch_dims, inputs = inputs  # unpack inputs.
-    def _reshape_to_1d(t):
-      # Keep batch dimensions and flatten the rest into as single dimension.
-      batch_dims = tf.shape(t)[:num_batch_dims]
-      dims = tf.concat([batch_dims, [-1]], axis=0)
-      # We reshape to BATCH_DIM_1 x ... x BATCH_DIM_k x -1, which will make
-      # the last dimension as large as required to accommodate the tensor.
-      return tf.reshape(t, dims)
     inputs = [i for i in tf.nest.flatten(inputs) if i is not None]
-    flat_tensors = [_reshape_to_1d(t) for t in inputs]
-    float_tensors = [tf.cast(t, dtype=tf.float32) for t in flat_tensors]
-
-    if not float_tensors:
+    if not inputs:
       raise Error('No inputs that are not None.')
 
+    # Keep batch dimensions and flatten the rest into as single dimension.
+    # All inputs share the same batch dimensions, as required to concatenate
+    # them, so the target shape is only computed once.
+    batch_dims = tf.shape(inputs[0])[:num_batch_dims]
+    # We reshape to BATCH_DIM_1 x ... x BATCH_DIM_k x -1, which will make
+    # the last dimension as large as required to accommodate each tensor.
+    dims = tf.concat([batch_dims, [-1]], axis=0)
+    float_tensors = [tf.cast(tf.reshape(t, dims), dtype=self.compute_dtype)
+                     for t in inputs]
     return tf.concat(float_tensors, axis=-1)
 
 
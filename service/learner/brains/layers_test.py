@@ -102,6 +102,11 @@ class LayersTest(parameterized.TestCase):
 
     self.assertEqual(result.numpy().tolist(), expected)
 
+  def test_pad1d_unsupported_mode(self):
+    with self.assertRaisesWithLiteralMatch(
+        ValueError, 'Padding mode mirror not supported.'):
+      layers.Pad1D([1, 2], 'mirror')
+
   @parameterized.parameters(
       ([],),
       ([1,],),
@@ -44,6 +44,9 @@ class NumpyReplayBuffer:
       shape = (capacity,) + spec.shape
       return np.zeros(shape, dtype=spec.dtype.as_numpy_dtype())
     self._buffer = tf.nest.map_structure(_CreateBuffer, spec)
+    # Flattened view of the backing arrays (one contiguous array per leaf) so
+    # that inserts don't need to traverse the nest.
+    self._flat_buffer = tf.nest.flatten(self._buffer)
     self._size = 0  # Elements in buffer.
     self._rr_ptr = 0  # Fifo-pointer to the next element to overwrite.
     self._spec = spec  # Spec nest
@@ -51,17 +54,37 @@ class NumpyReplayBuffer:
 
   def Clear(self):
     """Clear the replay buffer."""
-    def _Clear(buf):
-      """Reset the specified numpy array to zeros.
-
-      Args:
-        buf: Numpy array to clear to zeros.
-      """
+    for buf in self._flat_buffer:
       buf.fill(0)
-    tf.nest.map_structure(_Clear, self._buffer)
     self._size = 0
     self._rr_ptr = 0
 
+  def _CopySegments(self, size):
+    """Compute the slices required to copy an input into the ring buffer.
+
+    Args:
+      size: Number of elements in the input.
+
+    Returns:
+      List of (buf_start, buf_end, t_start, t_end) tuples where each tuple
+      describes a contiguous region of the input t[t_start:t_end] to copy to
+      buf[buf_start:buf_end].
+    """
+    segments = []
+    buf_start = self._rr_ptr  # Pointer to the buffer start.
+    t_start = 0  # Pointer to the input_tensor
+    todo = size  # Number of elements to copy
+    while todo > 0:  # Repeatedly copy until end of buffer.
+      buf_end = min(self._capacity, buf_start + todo)
+      buf_len = (buf_end - buf_start)
+      t_end = t_start + buf_len
+      segments.append((buf_start, buf_end, t_start, t_end))
+
+      buf_start = (buf_start + buf_len) % self._capacity
+      t_start += buf_len
+      todo -= buf_len
+    return segments
+
   def Add(self, nested_tensor):
     """Add an input of arbitrary length to the buffer.
 
@@ -69,22 +92,14 @@ class NumpyReplayBuffer:
       nested_tensor: A tensor nest where the first dimension corresponds to
         the length of the input. (Must be at least one)
     """
+    tf.nest.assert_same_structure(self._buffer, nested_tensor)
     size = tensor_nest.batch_size(nested_tensor)
-    def _Update(buf, t):
-      """Update buffer buf from tensor t."""
-      buf_start = self._rr_ptr  # Pointer to the buffer start.
-      t_start = 0  # Pointer to the input_tensor
-      todo = size  # Number of elements to copy
-      while todo > 0:  # Repeatedly copy until end of buffer.
-        buf_end = min(self._capacity, buf_start + todo)
-        buf_len = (buf_end - buf_start)
-        t_end = t_start + buf_len
+    # The ring buffer layout is the same for all leaves so only compute the
+    # regions to copy once.
+    segments = self._CopySegments(size)
+    for buf, t in zip(self._flat_buffer, tf.nest.flatten(nested_tensor)):
+      for buf_start, buf_end, t_start, t_end in segments:
         buf[buf_start:buf_end] = t[t_start:t_end]
-
-        buf_start = (buf_start + buf_len) % self._capacity
-        t_start += buf_len
-        todo -= buf_len
-    tf.nest.map_structure(_Update, self._buffer, nested_tensor)
     # Update size of the buffer.
     self._size = min(self._capacity, self._size + size)
     # Update round robin pointer.
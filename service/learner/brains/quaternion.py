@@ -102,7 +102,43 @@ def rotate(v, q):
     3D vectors that represents each input vector multiplied by its corresponding
     quaternion.
   """
-  return multiply(multiply(q, v), conjugate(q))[..., :3]
+  # Computes q * v * conjugate(q) expanded for q = (u, w) as
+  # (w^2 - u.u) v + 2 (u.v) u + 2 w (u x v), which avoids converting v to a
+  # quaternion and computing two Hamilton products.
+  u = q[..., :3]
+  w = q[..., 3:4]
+  ux, uy, uz = u[..., 0], u[..., 1], u[..., 2]
+  vx, vy, vz = v[..., 0], v[..., 1], v[..., 2]
+  u_cross_v = tf.stack(
+      [uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx], axis=-1)
+  u_dot_u = tf.reduce_sum(u * u, axis=-1, keepdims=True)
+  u_dot_v = tf.reduce_sum(u * v, axis=-1, keepdims=True)
+  return (w * w - u_dot_u) * v + 2 * u_dot_v * u + 2 * w * u_cross_v
+
+
+def to_rotation_matrix(q):
+  """Convert a quaternion tensor to a tensor of rotation matrices.
+
+  Args:
+    q: A quaternion tensor of shape B1 x ... x Bn x 4.
+  Returns:
+    A matrix tensor of shape B1 x ... x Bn x 3 x 3. Multiplying a 3D column
+    vector by a matrix is equivalent to rotate(), so column i of each matrix is
+    the i-th standard basis vector rotated by the corresponding quaternion.
+  """
+  # Via https://en.wikipedia.org/wiki/Quaternions_and_spatial_rotation using
+  # the homogeneous form of the matrix which, like rotate(), doesn't assume
+  # that q is a unit quaternion.
+  x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+  xx, yy, zz, ww = x * x, y * y, z * z, w * w
+  xy, xz, yz = x * y, x * z, y * z
+  wx, wy, wz = w * x, w * y, w * z
+  rows = [
+      [ww + xx - yy - zz, 2 * (xy - wz), 2 * (xz + wy)],
+      [2 * (xy + wz), ww - xx + yy - zz, 2 * (yz - wx)],
+      [2 * (xz - wy), 2 * (yz + wx), ww - xx - yy + zz],
+  ]
+  return tf.stack([tf.stack(row, axis=-1) for row in rows], axis=-2)
 
 
 def from_axis_angle(axis, angle, angle_scalar=True):
@@ -150,6 +150,20 @@ class QuaternionTest(parameterized.TestCase):
 
     self.assert_tensors_almost_equal(result, vector)
 
+  @parameterized.parameters(0, 1, 2, 3)
+  def test_rotation_matrix(self, batch_dims):
+    """Test that multiplying by a rotation matrix matches rotate()."""
+    shape = [2] * batch_dims
+    quaternions = tf.random.normal(shape + [4], dtype=tf.float32)
+    vector = tf.random.normal(shape + [3], dtype=tf.float32)
+
+    result = tf.linalg.matvec(quaternion.to_rotation_matrix(quaternions),
+                              vector)
+
+    self.assertEqual(result.shape, shape + [3])
+    self.assert_tensors_almost_equal(
+        result, quaternion.rotate(vector, quaternions))
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -931,6 +931,11 @@ class ProtobufNode:
     proto: Referenced protobuf instance.
   """
 
+  # Nodes are read on each traversal of a spec tree, e.g when generating or
+  # converting data, so store attributes in slots rather than a dictionary.
+  __slots__ = ('_proto', '_name', '_proto_field_name',
+               '_children_by_proto_field_name', '_parent', '_path')
+
   # Lazily initialized by _from_spec().
   _SPEC_PROTOCLASS_TO_PARSER = None
 
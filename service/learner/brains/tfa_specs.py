@@ -62,6 +62,32 @@ class TfAgentsSpecBaseMixIn:
         options=specs.ProtobufDataValidationOptions(
             check_feeler_data_with_spec=False)).values()))
 
+  def tfa_value_batch(self, data_list):
+    """Converts a sequence of ActionData or ObservationData to TF Agents format.
+
+    This is equivalent to stacking the result of tfa_value() for each item in
+    data_list but converts each leaf of the nest with a single allocation.
+
+    Args:
+      data_list: Non-empty sequence of ActionData or ObservationData protos.
+
+    Returns:
+      The data formatted as a dictionary of dictionaries of numpy arrays where
+      the outer dimension of each array is the batch dimension.
+    """
+    options = specs.ProtobufDataValidationOptions(
+        check_feeler_data_with_spec=False)
+    proto_nests = [
+        next(iter(self._spec_proto_node.data_to_proto_nest(
+            data, options=options).values()))
+        for data in data_list]
+    leaf_names = [node.path for node in tf.nest.flatten(self._node_nest)]
+    leaf_columns = zip(*[tf.nest.flatten(nest) for nest in proto_nests])
+    return tf.nest.pack_sequence_as(proto_nests[0], [
+        data_protobuf_converter.DataProtobufConverter.leaves_to_tensor_batch(
+            list(column), name)
+        for column, name in zip(leaf_columns, leaf_names)])
+
 
 class SpecBase(specs.SpecBase, TfAgentsSpecBaseMixIn):
   """SpecBase that converts to TF-Agents specs and numpy arrays."""
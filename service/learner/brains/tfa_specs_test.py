@@ -176,6 +176,43 @@ class TfAgentsSpecBaseMixInTest(absltest.TestCase):
     }
     self.assertEqual(want, value)
 
+  def test_observation_data_batch_to_nest(self):
+    """Tests batch conversion from ObservationData to a tf-agents nest."""
+    observation_spec = observation_pb2.ObservationSpec()
+    text_format.Parse(specs_test._OBSERVATION_SPEC, observation_spec)
+    observation_data = observation_pb2.ObservationData()
+    text_format.Parse(specs_test._OBSERVATION_DATA, observation_data)
+    other_observation_data = observation_pb2.ObservationData()
+    other_observation_data.CopyFrom(observation_data)
+    other_observation_data.player.position.x = 5.0
+    spec = tfa_specs.ObservationSpec(observation_spec)
+    data_list = [observation_data, other_observation_data]
+
+    value = spec.tfa_value_batch(data_list)
+    want = tf.nest.map_structure(
+        lambda *x: np.stack(x), *[spec.tfa_value(d) for d in data_list])
+    tf.nest.assert_same_structure(value, want)
+    value = tf.nest.map_structure(lambda x: x.round(2).tolist(), value)
+    want = tf.nest.map_structure(lambda x: x.round(2).tolist(), want)
+    self.assertEqual(want, value)
+
+  def test_action_data_batch_to_nest(self):
+    """Tests batch conversion from ActionData to a tf-agents nest."""
+    action_spec = action_pb2.ActionSpec()
+    text_format.Parse(specs_test._ACTION_SPEC, action_spec)
+    action_data = action_pb2.ActionData()
+    text_format.Parse(specs_test._ACTION_DATA, action_data)
+    value = tfa_specs.ActionSpec(action_spec).tfa_value_batch(
+        [action_data, action_data])
+    value = tf.nest.map_structure(lambda x: x.tolist(), value)
+    want = {
+        'trouble': [[1500.0], [1500.0]],
+        'what_do': [[1], [1]],
+        'left_stick': [[0.0, 1.0], [0.0, 1.0]],
+        'right_stick': [[-1.0, 0.0], [-1.0, 0.0]]
+    }
+    self.assertEqual(want, value)
+
 
 
 
@@ -26,6 +26,7 @@ from absl import flags
 from absl import logging
 from data_store import data_store as data_store_module
 from data_store import file_system as data_store_file_system
+from google.protobuf.internal import api_implementation
 from learner import learner as learner_module
 from learner import storage
 from log import falken_logging
@@ -66,6 +67,16 @@ class LearnerService:
     """Create a learner instance from the module's flags."""
     falken_logging.info(
         f'Creating Learner that uses data store {FLAGS.root_dir}')
+    # Generating and converting training data is dominated by protobuf field
+    # access which is an order of magnitude slower when using the pure Python
+    # implementation. The C++ implementation is selected by default when it's
+    # available unless PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION overrides it.
+    if api_implementation.Type() == 'python':
+      falken_logging.warn(
+          'Using the pure Python protobuf implementation, learner '
+          'performance will be degraded. Install a protobuf package with '
+          'the C++ extension and set PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION '
+          'to cpp (or leave it unset) to improve performance.')
     # TemporaryDirectory objects.
     self._temporary_directories = []
     fs = data_store_file_system.FileSystem(FLAGS.root_dir)